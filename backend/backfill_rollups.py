@@ -0,0 +1,23 @@
+"""
+Script to rebuild analytics rollups from activities and the credit ledger
+Run: python backfill_rollups.py [START_DATE [END_DATE]]
+
+Only whole, closed days the sources still cover are recounted; dates are ISO
+(YYYY-MM-DD) and default to everything available.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from services.rollups import rebuild
+
+async def backfill_rollups(start=None, end=None):
+    results = await rebuild(start, end)
+    for metric, result in results.items():
+        if result["start"] is None:
+            print(f"✓ Nothing to roll up for {metric}")
+        else:
+            print(f"✓ Rolled up {result['count']} {metric} events from {result['start']:%Y-%m-%d} to {result['end']:%Y-%m-%d}")
+
+if __name__ == "__main__":
+    dates = [datetime.fromisoformat(arg) for arg in sys.argv[1:3]]
+    asyncio.run(backfill_rollups(*dates))
@@ -0,0 +1,56 @@
+"""
+Script to stamp userId on messages written before search was added, and to
+give message blocks compacted before search their owner and indexed terms
+Run: python backfill_search.py
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from services.message_store import block_terms, unpack_block
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+async def backfill_search():
+    # Connect to MongoDB
+    mongo_url = os.environ.get('MONGO_URL')
+    db_name = os.environ.get('DB_NAME', 'emergent_db')
+    
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    
+    updated = 0
+    blocks = 0
+    async for conversation in db.conversations.find({}, {"userId": 1}):
+        conversation_id = str(conversation["_id"])
+        result = await db.messages.update_many(
+            {"conversationId": conversation_id, "userId": {"$exists": False}},
+            {"$set": {"userId": conversation["userId"]}}
+        )
+        updated += result.modified_count
+        result = await db.message_blocks.update_many(
+            {"conversationId": conversation_id, "userId": {"$ne": conversation["userId"]}},
+            {"$set": {"userId": conversation["userId"]}}
+        )
+        blocks += result.modified_count
+    
+    print(f"✓ Indexed {updated} messages for search")
+    print(f"✓ Assigned owners to {blocks} compacted message blocks")
+    
+    blocks = 0
+    async for block in db.message_blocks.find({"terms": {"$exists": False}}, {"data": 1}):
+        terms = block_terms(unpack_block(block["data"]))
+        await db.message_blocks.update_one(
+            {"_id": block["_id"]},
+            {"$set": {"terms": terms}, "$unset": {"text": ""}}
+        )
+        blocks += 1
+    
+    print(f"✓ Indexed {blocks} compacted message blocks for search")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_search())
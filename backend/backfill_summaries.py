@@ -0,0 +1,24 @@
+"""
+Script to fill in messageCount and lastMessagePreview on conversations created before summaries were kept
+Run: python backfill_summaries.py
+"""
+import asyncio
+from database import db
+from routes.conversations import PREVIEW_LENGTH
+from services.message_store import summarize
+
+async def backfill_summaries():
+    updated = 0
+    async for conversation in db.conversations.find({"messageCount": {"$exists": False}}, {"_id": 1}):
+        summary = await summarize(str(conversation["_id"]), PREVIEW_LENGTH)
+        # Skip conversations a live message write has summarized meanwhile
+        result = await db.conversations.update_one(
+            {"_id": conversation["_id"], "messageCount": {"$exists": False}},
+            {"$set": summary}
+        )
+        updated += result.modified_count
+    
+    print(f"✓ Summarized {updated} conversations")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_summaries())
@@ -0,0 +1,15 @@
+"""
+Script to compact old conversation history into compressed blocks
+Run: python compact_messages.py [age_days]
+"""
+import asyncio
+import sys
+from services.compaction import COMPACTION_AGE_DAYS, run_compaction
+
+async def compact_messages():
+    age_days = int(sys.argv[1]) if len(sys.argv) > 1 else COMPACTION_AGE_DAYS
+    total = await run_compaction(age_days)
+    print(f"✓ Compacted {total} messages older than {age_days} days")
+
+if __name__ == "__main__":
+    asyncio.run(compact_messages())
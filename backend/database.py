@@ -1,15 +1,20 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+import logging
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+logger = logging.getLogger(__name__)
+
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', '')
 db_name = os.environ.get('DB_NAME', 'emergent_db')
+activity_retention_days = int(os.environ.get('ACTIVITY_RETENTION_DAYS', '90'))
 
 if not mongo_url:
     raise ValueError("MONGO_URL environment variable is not set")
@@ -19,3 +24,91 @@ db = client[db_name]
 
 def get_database():
     return db
+
+async def _ensure_activity_retention():
+    """Index activities by timestamp, expiring them after the retention period (0 keeps them forever)"""
+    existing = (await db.activities.index_information()).get("timestamp_1")
+    try:
+        if activity_retention_days <= 0:
+            if existing and "expireAfterSeconds" in existing:
+                # Retention was switched off: a TTL index on the same key would block the plain one
+                await db.activities.drop_index("timestamp_1")
+            await db.activities.create_index("timestamp")
+            return
+        ttl = activity_retention_days * 24 * 3600
+        if existing is None:
+            await db.activities.create_index("timestamp", expireAfterSeconds=ttl)
+        elif existing.get("expireAfterSeconds") != ttl:
+            try:
+                # The index exists with another retention (or none); change it in place
+                await db.command("collMod", "activities", index={"keyPattern": {"timestamp": 1}, "expireAfterSeconds": ttl})
+            except OperationFailure:
+                # Older servers cannot turn a plain index into a TTL one; rebuild it
+                await db.activities.drop_index("timestamp_1")
+                await db.activities.create_index("timestamp", expireAfterSeconds=ttl)
+    except OperationFailure:
+        # Activities are an audit trail; a retention problem must not keep the API from starting
+        logger.exception("Could not apply ACTIVITY_RETENTION_DAYS=%d to the activities index", activity_retention_days)
+
+async def ensure_indexes():
+    """Create the indexes the API's query paths rely on"""
+    await db.messages.create_index([("conversationId", 1), ("timestamp", 1), ("_id", 1)])
+    await db.messages.create_index(
+        [("conversationId", 1), ("timestamp", 1)],
+        partialFilterExpression={"metadata.pinned": True},
+        name="pinned_messages"
+    )
+    await db.conversations.create_index([("userId", 1), ("updatedAt", -1), ("_id", -1)])
+    await db.conversations.create_index(
+        [("userId", 1)],
+        partialFilterExpression={"deleting": True},
+        name="deleting_conversations"
+    )
+    await db.message_blocks.create_index([("conversationId", 1), ("startTimestamp", 1), ("startId", 1)])
+    await db.message_blocks.create_index([("conversationId", 1), ("endTimestamp", 1), ("endId", 1)])
+    
+    await db.upload_sessions.create_index([("userId", 1), ("sha256", 1)])
+    await db.response_cache.create_index("expiresAt", expireAfterSeconds=0)
+    
+    # Sessions
+    await db.refresh_tokens.create_index("tokenHash", unique=True)
+    await db.refresh_tokens.create_index([("userId", 1), ("revokedAt", 1)])
+    await db.refresh_tokens.create_index("family")
+    await db.refresh_tokens.create_index("expiresAt", expireAfterSeconds=0)
+    await db.revoked_tokens.create_index("revokedAt")
+    await db.revoked_tokens.create_index("expiresAt", expireAfterSeconds=0)
+    await db.login_attempts.create_index("expiresAt", expireAfterSeconds=0)
+    
+    # Admin listings: one (sort key, _id) index per sort, plus the common equality filters
+    await db.users.create_index([("email", 1), ("_id", 1)])
+    await db.users.create_index([("name", 1), ("_id", 1)])
+    await db.users.create_index([("createdAt", -1), ("_id", -1)])
+    await db.users.create_index([("role", 1), ("createdAt", -1), ("_id", -1)])
+    await db.users.create_index([("subscription.plan", 1), ("createdAt", -1), ("_id", -1)])
+    await db.projects.create_index([("userId", 1), ("createdAt", -1), ("_id", -1)])
+    await db.projects.create_index([("name", 1), ("_id", 1)])
+    await db.projects.create_index([("createdAt", -1), ("_id", -1)])
+    await db.projects.create_index([("updatedAt", -1), ("_id", -1)])
+    await db.projects.create_index([("status", 1), ("createdAt", -1), ("_id", -1)])
+    await _ensure_activity_retention()
+    await db.users.create_index("reservations.at", sparse=True)
+    await db.rollups.create_index([("metric", 1), ("granularity", 1), ("bucket", 1)])
+    await db.rollups.create_index("expiresAt", expireAfterSeconds=0)
+    # Exports and rollup rebuilds scan these in (timestamp, _id) order
+    await db.activities.create_index([("timestamp", 1), ("_id", 1)])
+    await db.credit_transactions.create_index([("timestamp", 1), ("_id", 1)])
+    
+    # Cascade deletion: job queue plus the per-user lookups its steps run
+    await db.deletion_jobs.create_index([("status", 1), ("createdAt", 1)])
+    await db.deletion_jobs.create_index("expiresAt", expireAfterSeconds=0)
+    await db.credit_transactions.create_index([("userId", 1), ("timestamp", -1)])
+    await db.activities.create_index("userId")
+    await db.user_mcp_configs.create_index("userId")
+    
+    # Per-tenant full-text search
+    await db.messages.create_index([("userId", 1), ("content", "text")], name="message_search")
+    await db.conversations.create_index([("userId", 1), ("projectName", "text")], name="conversation_search")
+    if "block_search" in await db.message_blocks.index_information():
+        # Blocks used to index their full text; a collection holds only one text index
+        await db.message_blocks.drop_index("block_search")
+    await db.message_blocks.create_index([("userId", 1), ("terms", "text")], name="block_terms_search")
@@ -127,6 +127,7 @@ async def init_defaults():
         print(f"✓ {existing_models} AI models already exist")
     else:
         await db.ai_models.insert_many(models)
+        await db.catalog_versions.update_one({"_id": "ai_models"}, {"$inc": {"version": 1}}, upsert=True)
         print(f"✓ Created {len(models)} default AI models")
     
     # Default MCP Tools
@@ -211,6 +212,7 @@ async def init_defaults():
         print(f"✓ {existing_tools} MCP tools already exist")
     else:
         await db.mcp_tools.insert_many(mcp_tools)
+        await db.catalog_versions.update_one({"_id": "mcp_tools"}, {"$inc": {"version": 1}}, upsert=True)
         print(f"✓ Created {len(mcp_tools)} default MCP tools")
     
     client.close()
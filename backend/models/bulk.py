@@ -0,0 +1,41 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+from models.user import UserRole, AuthProvider, SubscriptionPlan
+
+class UserSelector(BaseModel):
+    """Users to act on: explicit ids, or every user matching the filter fields"""
+    ids: Optional[List[str]] = None
+    role: Optional[UserRole] = None
+    plan: Optional[SubscriptionPlan] = None
+    provider: Optional[AuthProvider] = None
+    createdAfter: Optional[datetime] = None
+    createdBefore: Optional[datetime] = None
+
+class BulkRoleChange(UserSelector):
+    newRole: UserRole
+
+class BulkPlanChange(UserSelector):
+    newPlan: SubscriptionPlan
+
+class BulkCreditGrant(UserSelector):
+    amount: float = Field(gt=0)
+    description: str = "Credits granted by admin"
+
+class CatalogSelector(BaseModel):
+    """Models or tools to act on: explicit ids, or every entry of a provider/type"""
+    ids: Optional[List[str]] = None
+    provider: Optional[str] = None  # models
+    type: Optional[str] = None  # MCP tools
+    enabled: bool
+
+class BulkItemResult(BaseModel):
+    id: str
+    status: str  # ok, unchanged, not_found, invalid_id, error
+    detail: Optional[str] = None
+    jobId: Optional[str] = None
+
+class BulkResult(BaseModel):
+    requested: int
+    succeeded: int
+    results: List[BulkItemResult]
@@ -31,6 +31,7 @@ class GitHubRepo(BaseModel):
 class Message(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
     conversationId: str
+    userId: Optional[str] = None
     role: MessageRole
     content: str
     attachments: List[FileAttachment] = []
@@ -48,6 +49,7 @@ class ConversationSettings(BaseModel):
     template: Optional[str] = None
     maxTokens: int = 4096
     temperature: float = 0.7
+    cacheResponses: bool = True
 
 class Conversation(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
@@ -56,6 +58,8 @@ class Conversation(BaseModel):
     settings: ConversationSettings = ConversationSettings()
     githubRepo: Optional[GitHubRepo] = None
     messages: List[str] = []  # Message IDs
+    messageCount: int = 0
+    lastMessagePreview: Optional[str] = None
     creditsUsed: float = 0.0
     status: str = "active"  # active, archived, deleted
     createdAt: datetime = Field(default_factory=datetime.utcnow)
@@ -64,6 +68,16 @@ class Conversation(BaseModel):
     class Config:
         populate_by_name = True
 
+class ConversationSummary(BaseModel):
+    id: str = Field(alias="_id")
+    projectName: str = "Untitled Project"
+    updatedAt: datetime
+    messageCount: int = 0
+    lastMessagePreview: Optional[str] = None
+
+    class Config:
+        populate_by_name = True
+
 class ConversationCreate(BaseModel):
     projectName: str = "Untitled Project"
     settings: Optional[ConversationSettings] = None
@@ -39,6 +39,19 @@ class Project(BaseModel):
             }
         }
 
+class ProjectSummary(BaseModel):
+    id: str = Field(alias="_id")
+    userId: str
+    name: str
+    type: ProjectType = ProjectType.WEB
+    status: ProjectStatus = ProjectStatus.DRAFT
+    url: Optional[str] = None
+    createdAt: datetime
+    updatedAt: datetime
+
+    class Config:
+        populate_by_name = True
+
 class ProjectCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+
+class ConversationHit(BaseModel):
+    id: str = Field(alias="_id")
+    projectName: str
+    updatedAt: Optional[datetime] = None
+    score: float
+
+    class Config:
+        populate_by_name = True
+
+class MessageHit(BaseModel):
+    id: str = Field(alias="_id")
+    conversationId: str
+    role: str
+    timestamp: datetime
+    score: float
+    snippet: str
+
+    class Config:
+        populate_by_name = True
+
+class SearchResults(BaseModel):
+    query: str
+    conversations: List[ConversationHit] = []
+    messages: List[MessageHit] = []
+    offset: int = 0
+    hasMore: bool = False
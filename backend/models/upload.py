@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+
+class UploadStatus(str, Enum):
+    PENDING = "pending"
+    COMPLETE = "complete"
+
+class UploadSession(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    userId: str
+    filename: str
+    size: int
+    type: str
+    offset: int = 0
+    status: UploadStatus = UploadStatus.PENDING
+    sha256: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        populate_by_name = True
+
+class UploadCreate(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(gt=0)
+    type: str = "application/octet-stream"
@@ -1,21 +1,115 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Dict
-from models.user import UserResponse, UserRole
-from models.project import Project
+from fastapi import APIRouter, HTTPException, Query, Response, status, Depends
+from typing import List, Dict, Optional
+from enum import Enum
+from models.user import UserResponse, UserRole, AuthProvider, SubscriptionPlan, SubscriptionStatus
+from models.project import ProjectStatus, ProjectSummary, ProjectType
 from models.activity import Activity
-from utils.auth import get_current_admin
+from services.activity_log import activity_writer
+from services.catalog import catalog
+from services.response_cache import response_cache
+from services import credits, deletion, stats
+from services.rate_limit import login_throttle
+from services.revocation import revocations
+from services.rollups import GRANULARITIES, MAX_QUERY_BUCKETS, METRIC_DIMENSIONS, rollups, query as query_rollups
+from services.user_cache import user_profiles
+from utils.pagination import encode_cursor, keyset_filter, set_cursor_headers
+from utils.auth import get_current_admin, password_hasher, token_cache, revoke_user_tokens
 from bson import ObjectId
-from datetime import datetime, timedelta
+from datetime import datetime
 from database import db
+import re
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+# Only the columns the admin tables show; never the password hash or project lists
+USER_PROJECTION = {
+    "email": 1, "name": 1, "avatar": 1, "role": 1, "provider": 1,
+    "subscription": 1, "createdAt": 1, "lastLogin": 1
+}
+PROJECT_PROJECTION = {
+    "userId": 1, "name": 1, "type": 1, "status": 1, "url": 1,
+    "createdAt": 1, "updatedAt": 1
+}
+
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+class UserSort(str, Enum):
+    CREATED_AT = "createdAt"
+    EMAIL = "email"
+    NAME = "name"
+
+class ProjectSort(str, Enum):
+    CREATED_AT = "createdAt"
+    UPDATED_AT = "updatedAt"
+    NAME = "name"
+
+def _prefix(field: str, text: str) -> dict:
+    """Anchored, case-sensitive regex so the match can use the field's index"""
+    return {field: {"$regex": f"^{re.escape(text)}"}}
+
+def _created_range(after: Optional[datetime], before: Optional[datetime]) -> list:
+    created = {}
+    if after:
+        created["$gte"] = after
+    if before:
+        created["$lt"] = before
+    return [{"createdAt": created}] if created else []
+
+async def _keyset_page(collection, filters: list, projection: dict, sort_field: str, order: SortOrder, cursor: Optional[str], limit: int, response: Response) -> list:
+    """Fetch one keyset page sorted by (sort_field, _id) and set the cursor headers"""
+    direction = 1 if order == SortOrder.ASC else -1
+    bound = keyset_filter(sort_field, cursor, direction)
+    if bound:
+        filters = filters + [bound]
+    query = {"$and": filters} if filters else {}
+    
+    docs = await collection.find(query, projection) \
+        .sort([(sort_field, direction), ("_id", direction)]).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if docs:
+        last = docs[-1]
+        set_cursor_headers(response, next_cursor=encode_cursor(last[sort_field], last["_id"]), has_more=has_more)
+    else:
+        set_cursor_headers(response, has_more=False)
+    
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return docs
+
 @router.get("/users", response_model=List[UserResponse])
-async def get_all_users(current_admin: dict = Depends(get_current_admin)):
-    """Get all users (admin only)"""
-    users = await db.users.find().to_list(1000)
-    for user in users:
-        user["_id"] = str(user["_id"])
+async def get_all_users(
+    response: Response,
+    role: Optional[UserRole] = None,
+    plan: Optional[SubscriptionPlan] = None,
+    status_filter: Optional[SubscriptionStatus] = Query(None, alias="status"),
+    provider: Optional[AuthProvider] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    q: Optional[str] = Query(None, min_length=1, description="Email or name prefix"),
+    sort: UserSort = UserSort.CREATED_AT,
+    order: SortOrder = SortOrder.DESC,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Get a page of users, filtered and sorted (admin only)"""
+    filters = [{"deleting": {"$ne": True}}] + _created_range(created_after, created_before)
+    if role:
+        filters.append({"role": role})
+    if plan:
+        filters.append({"subscription.plan": plan})
+    if status_filter:
+        filters.append({"subscription.status": status_filter})
+    if provider:
+        filters.append({"provider": provider})
+    if q:
+        filters.append({"$or": [_prefix("email", q), _prefix("name", q)]})
+    
+    users = await _keyset_page(db.users, filters, USER_PROJECTION, sort.value, order, cursor, limit, response)
     return [UserResponse(**user) for user in users]
 
 @router.get("/users/{user_id}", response_model=UserResponse)
@@ -29,7 +123,7 @@ async def get_user_by_id(user_id: str, current_admin: dict = Depends(get_current
             detail="Invalid user ID"
         )
     
-    if not user:
+    if not user or user.get("deleting"):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
@@ -62,58 +156,82 @@ async def update_user_role(
             detail="User not found"
         )
     
+    # Outstanding access tokens carry the old role; force a refresh to pick up the new one
+    user_profiles.invalidate(user_id)
+    await revoke_user_tokens(user_id)
+    
     return {"message": f"User role updated to {role}"}
 
-@router.delete("/users/{user_id}")
+@router.delete("/users/{user_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_user(user_id: str, current_admin: dict = Depends(get_current_admin)):
-    """Delete user (admin only)"""
-    try:
-        # Delete user's projects first
-        await db.projects.delete_many({"userId": user_id})
-        
-        # Delete user
-        result = await db.users.delete_one({"_id": ObjectId(user_id)})
-    except Exception:
+    """Delete user and everything they own (admin only); the cascade runs in the background"""
+    if not ObjectId.is_valid(user_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user ID"
         )
+    if user_id == current_admin["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot delete yourself"
+        )
     
-    if result.deleted_count == 0:
+    job_id = await deletion.start_user_deletion(user_id)
+    if not job_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    return {"message": "User and associated projects deleted successfully"}
+    return {"message": "User deletion started", "jobId": job_id}
+
+@router.get("/deletion-jobs/{job_id}")
+async def get_deletion_job(job_id: str, current_admin: dict = Depends(get_current_admin)):
+    """Get the progress of a background deletion (admin only)"""
+    job = await deletion.get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deletion job not found"
+        )
+    return job
 
-@router.get("/projects", response_model=List[Project])
-async def get_all_projects(current_admin: dict = Depends(get_current_admin)):
-    """Get all projects (admin only)"""
-    projects = await db.projects.find().to_list(1000)
-    for project in projects:
-        project["_id"] = str(project["_id"])
-    return [Project(**project) for project in projects]
+@router.get("/projects", response_model=List[ProjectSummary])
+async def get_all_projects(
+    response: Response,
+    status_filter: Optional[ProjectStatus] = Query(None, alias="status"),
+    type: Optional[ProjectType] = None,
+    user_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    q: Optional[str] = Query(None, min_length=1, description="Name prefix"),
+    sort: ProjectSort = ProjectSort.CREATED_AT,
+    order: SortOrder = SortOrder.DESC,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Get a page of projects, filtered and sorted (admin only)"""
+    filters = _created_range(created_after, created_before)
+    if status_filter:
+        filters.append({"status": status_filter})
+    if type:
+        filters.append({"type": type})
+    if user_id:
+        filters.append({"userId": user_id})
+    if q:
+        filters.append(_prefix("name", q))
+    
+    projects = await _keyset_page(db.projects, filters, PROJECT_PROJECTION, sort.value, order, cursor, limit, response)
+    return [ProjectSummary(**project) for project in projects]
 
 @router.get("/stats")
-async def get_system_stats(current_admin: dict = Depends(get_current_admin)):
-    """Get system statistics (admin only)"""
-    # Count users
-    total_users = await db.users.count_documents({})
-    active_users = await db.users.count_documents({
-        "lastLogin": {"$gte": datetime.utcnow() - timedelta(days=30)}
-    })
-    
-    # Count projects by status
-    total_projects = await db.projects.count_documents({})
-    deployed_projects = await db.projects.count_documents({"status": "deployed"})
-    building_projects = await db.projects.count_documents({"status": "building"})
-    draft_projects = await db.projects.count_documents({"status": "draft"})
-    
-    # Count users by subscription
-    free_users = await db.users.count_documents({"subscription.plan": "free"})
-    standard_users = await db.users.count_documents({"subscription.plan": "standard"})
-    pro_users = await db.users.count_documents({"subscription.plan": "pro"})
+async def get_system_stats(
+    refresh: bool = False,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Get system statistics from the materialized snapshot (admin only)"""
+    snapshot = await stats.get_snapshot(refresh=refresh)
     
     # Recent activities
     recent_activities = await db.activities.find().sort("timestamp", -1).limit(10).to_list(10)
@@ -121,22 +239,11 @@ async def get_system_stats(current_admin: dict = Depends(get_current_admin)):
         activity["_id"] = str(activity["_id"])
     
     return {
-        "users": {
-            "total": total_users,
-            "active": active_users,
-            "bySubscription": {
-                "free": free_users,
-                "standard": standard_users,
-                "pro": pro_users
-            }
-        },
-        "projects": {
-            "total": total_projects,
-            "deployed": deployed_projects,
-            "building": building_projects,
-            "draft": draft_projects
-        },
-        "recentActivities": recent_activities
+        "users": snapshot["users"],
+        "projects": snapshot["projects"],
+        "recentActivities": recent_activities,
+        "computedAt": snapshot["computedAt"],
+        "snapshotAgeSeconds": round((datetime.utcnow() - snapshot["computedAt"]).total_seconds(), 1)
     }
 
 @router.get("/activities", response_model=List[Activity])
@@ -149,3 +256,67 @@ async def get_activities(
     for activity in activities:
         activity["_id"] = str(activity["_id"])
     return [Activity(**activity) for activity in activities]
+
+class AnalyticsMetric(str, Enum):
+    ACTIVITY = "activity"
+    TURNS = "turns"
+
+class Granularity(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+@router.get("/analytics")
+async def get_analytics(
+    start: datetime,
+    end: Optional[datetime] = None,
+    metric: AnalyticsMetric = AnalyticsMetric.ACTIVITY,
+    granularity: Granularity = Granularity.HOUR,
+    group_by: Optional[str] = None,
+    action: Optional[str] = None,
+    resource: Optional[str] = None,
+    plan: Optional[str] = None,
+    model: Optional[str] = None,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Get bucketed activity or chat-turn counts over a time range (admin only)"""
+    end = end or datetime.utcnow()
+    dimensions = METRIC_DIMENSIONS[metric.value]
+    if group_by and group_by not in dimensions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"group_by must be one of: {', '.join(dimensions)}"
+        )
+    if (end - start).total_seconds() / GRANULARITIES[granularity.value] > MAX_QUERY_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Range too large for this granularity"
+        )
+    
+    given = {"action": action, "resource": resource, "plan": plan, "model": model}
+    filters = {name: value for name, value in given.items() if value is not None and name in dimensions}
+    
+    return {
+        "metric": metric,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "series": await query_rollups(metric.value, granularity.value, start, end, group_by, filters)
+    }
+
+@router.get("/metrics")
+async def get_runtime_metrics(current_admin: dict = Depends(get_current_admin)):
+    """Get in-process cache and runtime metrics for this worker (admin only)"""
+    return {
+        "responseCache": response_cache.stats(),
+        "passwordHasher": password_hasher.stats(),
+        "tokenCache": token_cache.stats(),
+        "revocations": revocations.stats(),
+        "userProfiles": user_profiles.stats(),
+        "loginThrottle": login_throttle.stats(),
+        "activityLog": activity_writer.stats(),
+        "creditLedger": {**credits.ledger.stats(), "reservationsReaped": credits.reservation_reaper.released},
+        "rollups": rollups.stats(),
+        "deletions": deletion.deletion_worker.stats(),
+        "catalog": catalog.stats()
+    }
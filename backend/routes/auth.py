@@ -1,12 +1,41 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, Response, status, Depends
 from datetime import datetime, timedelta
 from typing import Dict
 from models.user import User, UserCreate, UserLogin, UserResponse, UserRole, AuthProvider
-from utils.auth import hash_password, verify_password, create_access_token, get_current_user
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel
+from typing import Optional
+from bson import ObjectId
+from services import refresh_tokens
+from services import stats
+from services.rate_limit import login_throttle, client_ip
+from services.user_cache import user_profiles
+from utils.auth import password_hasher, create_access_token, get_current_user, revoke_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from utils.etag import check_etag
 from database import db
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
+optional_bearer = HTTPBearer(auto_error=False)
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+async def _issue_tokens(user_id: str, email: str, role: str, family: Optional[str] = None, refresh_token: Optional[str] = None) -> Dict:
+    """Short-lived access token plus a refresh token"""
+    access_token = create_access_token(
+        data={"sub": user_id, "email": email, "role": role}
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token or await refresh_tokens.issue(user_id, family),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
 @router.post("/register", response_model=Dict)
 async def register(user_data: UserCreate):
     """Register a new user"""
@@ -22,7 +51,7 @@ async def register(user_data: UserCreate):
     user = User(
         email=user_data.email,
         name=user_data.name,
-        password=hash_password(user_data.password),
+        password=await password_hasher.hash(user_data.password),
         provider=AuthProvider.EMAIL,
         role=UserRole.USER
     )
@@ -31,20 +60,22 @@ async def register(user_data: UserCreate):
     result = await db.users.insert_one(user_dict)
     user_id = str(result.inserted_id)
     
-    # Create access token
-    access_token = create_access_token(
-        data={"sub": user_id, "email": user.email, "role": user.role}
-    )
+    # Create access and refresh tokens
+    tokens = await _issue_tokens(user_id, user.email, user.role)
     
     # Update last login
     await db.users.update_one(
         {"_id": result.inserted_id},
         {"$set": {"lastLogin": datetime.utcnow()}}
     )
+    await stats.bump({
+        "users.total": 1,
+        "users.active": 1,
+        f"users.bySubscription.{user.subscription.plan.value}": 1
+    })
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **tokens,
         "user": {
             "id": user_id,
             "email": user.email,
@@ -55,38 +86,46 @@ async def register(user_data: UserCreate):
     }
 
 @router.post("/login", response_model=Dict)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
     """Login with email and password"""
+    # Turn away throttled clients before any lookup or hashing work
+    ip = client_ip(request)
+    await login_throttle.check(ip, credentials.email)
+    
     # Find user
     user = await db.users.find_one({"email": credentials.email})
-    if not user:
+    if not user or user.get("deleting"):
+        await login_throttle.record_failure(ip, credentials.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
     # Verify password
-    if not verify_password(credentials.password, user.get("password", "")):
+    if not await password_hasher.verify(credentials.password, user.get("password", "")):
+        await login_throttle.record_failure(ip, credentials.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
-    # Create access token
+    await login_throttle.record_success(credentials.email)
+    
+    # Create access and refresh tokens
     user_id = str(user["_id"])
-    access_token = create_access_token(
-        data={"sub": user_id, "email": user["email"], "role": user["role"]}
-    )
+    tokens = await _issue_tokens(user_id, user["email"], user["role"])
     
     # Update last login
     await db.users.update_one(
         {"_id": user["_id"]},
         {"$set": {"lastLogin": datetime.utcnow()}}
     )
+    user_profiles.invalidate(user_id)
+    if not stats.is_active(user.get("lastLogin")):
+        await stats.bump({"users.active": 1})
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **tokens,
         "user": {
             "id": user_id,
             "email": user["email"],
@@ -96,22 +135,47 @@ async def login(credentials: UserLogin):
         }
     }
 
+@router.post("/refresh", response_model=Dict)
+async def refresh(data: RefreshRequest):
+    """Exchange a refresh token for a new access token (the refresh token is rotated)"""
+    user_id, successor = await refresh_tokens.rotate(data.refresh_token)
+    
+    # Re-read role and email so changes made since login take effect
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"email": 1, "role": 1})
+    if not user:
+        await refresh_tokens.revoke(successor)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    
+    return await _issue_tokens(user_id, user["email"], user["role"], refresh_token=successor)
+
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
+async def get_current_user_info(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get current user information"""
-    from bson import ObjectId
-    
-    user = await db.users.find_one({"_id": ObjectId(current_user["id"])})
+    user = await user_profiles.get(current_user["id"])
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    user["_id"] = str(user["_id"])
+    # Profiles are small; hashing the cached fields is cheaper than re-sending them
+    not_modified = check_etag(request, response, "me", user)
+    if not_modified:
+        return not_modified
+    
     return UserResponse(**user)
 
 @router.post("/logout")
-async def logout():
-    """Logout user (client-side token removal)"""
+async def logout(
+    data: Optional[LogoutRequest] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer)
+):
+    """Logout user, revoking the presented access and refresh tokens"""
+    if credentials:
+        await revoke_access_token(credentials.credentials)
+    if data and data.refresh_token:
+        await refresh_tokens.revoke(data.refresh_token)
     return {"message": "Successfully logged out"}
\ No newline at end of file
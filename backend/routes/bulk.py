@@ -0,0 +1,253 @@
+from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Awaitable, Callable, Dict, List, Optional
+from models.bulk import (
+    BulkCreditGrant, BulkItemResult, BulkPlanChange, BulkResult, BulkRoleChange,
+    CatalogSelector, UserSelector
+)
+from models.credits import CreditTransaction
+from models.user import UserRole
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from services import deletion, stats
+from services.catalog import catalog
+from services.credits import ledger
+from services.user_cache import user_profiles
+from utils.auth import get_current_admin, revoke_users_tokens
+from bson import ObjectId
+from datetime import datetime
+from database import db
+import os
+
+router = APIRouter(prefix="/api/admin/bulk", tags=["admin"])
+
+BULK_CHUNK_SIZE = 500
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+
+# Builds the update for one document, or None if it is already in the requested state
+PlanUpdate = Callable[[dict], Optional[dict]]
+
+async def _resolve_ids(collection: str, ids: Optional[List[str]], query: Dict, results: List[BulkItemResult]) -> List[ObjectId]:
+    """Turn explicit ids or a filter into ObjectIds, recording malformed ids as failures"""
+    if ids is None and not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide ids or at least one filter"
+        )
+    
+    if ids is not None:
+        if len(ids) > BULK_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {BULK_MAX_ITEMS} items per request"
+            )
+        resolved = []
+        for item_id in dict.fromkeys(ids):
+            if ObjectId.is_valid(item_id):
+                resolved.append(ObjectId(item_id))
+            else:
+                results.append(BulkItemResult(id=item_id, status="invalid_id"))
+        return resolved
+    
+    docs = await db[collection].find(query, {"_id": 1}).limit(BULK_MAX_ITEMS + 1).to_list(BULK_MAX_ITEMS + 1)
+    if len(docs) > BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Filter matches more than {BULK_MAX_ITEMS} items; narrow it down"
+        )
+    return [doc["_id"] for doc in docs]
+
+async def _apply(
+    collection: str,
+    ids: List[ObjectId],
+    projection: Dict,
+    build_update: PlanUpdate,
+    results: List[BulkItemResult],
+    live_filter: Optional[Dict] = None
+) -> List[dict]:
+    """Apply per-document updates in unordered bulk_write chunks; returns the documents that changed"""
+    changed = []
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        chunk = ids[start:start + BULK_CHUNK_SIZE]
+        current = {
+            doc["_id"]: doc
+            for doc in await db[collection].find({"_id": {"$in": chunk}, **(live_filter or {})}, projection).to_list(None)
+        }
+        
+        operations, pending = [], []
+        for doc_id in chunk:
+            doc = current.get(doc_id)
+            if doc is None:
+                results.append(BulkItemResult(id=str(doc_id), status="not_found"))
+                continue
+            update = build_update(doc)
+            if update is None:
+                results.append(BulkItemResult(id=str(doc_id), status="unchanged"))
+                continue
+            operations.append(UpdateOne({"_id": doc_id}, update))
+            pending.append(doc)
+        if not operations:
+            continue
+        
+        failed = {}
+        try:
+            await db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+        
+        for index, doc in enumerate(pending):
+            if index in failed:
+                results.append(BulkItemResult(id=str(doc["_id"]), status="error", detail=failed[index]))
+            else:
+                results.append(BulkItemResult(id=str(doc["_id"]), status="ok"))
+                changed.append(doc)
+    return changed
+
+def _user_query(selector: UserSelector) -> Dict:
+    query = {}
+    if selector.role:
+        query["role"] = selector.role
+    if selector.plan:
+        query["subscription.plan"] = selector.plan
+    if selector.provider:
+        query["provider"] = selector.provider
+    created = {}
+    if selector.createdAfter:
+        created["$gte"] = selector.createdAfter
+    if selector.createdBefore:
+        created["$lt"] = selector.createdBefore
+    if created:
+        query["createdAt"] = created
+    if query:
+        query["deleting"] = {"$ne": True}
+    return query
+
+def _summary(requested: int, results: List[BulkItemResult]) -> BulkResult:
+    return BulkResult(
+        requested=requested,
+        succeeded=sum(1 for item in results if item.status in ("ok", "unchanged")),
+        results=results
+    )
+
+def _exclude(ids: List[ObjectId], item_id: str, detail: str, results: List[BulkItemResult]) -> List[ObjectId]:
+    """Drop one id from a bulk operation, recording it as an error"""
+    if not any(str(doc_id) == item_id for doc_id in ids):
+        return ids
+    results.append(BulkItemResult(id=item_id, status="error", detail=detail))
+    return [doc_id for doc_id in ids if str(doc_id) != item_id]
+
+async def _bulk_users(
+    selector: UserSelector,
+    projection: Dict,
+    build_update: PlanUpdate,
+    after: Callable[[List[dict]], Awaitable[None]],
+    protected: Optional[Dict[str, str]] = None
+) -> BulkResult:
+    results: List[BulkItemResult] = []
+    ids = await _resolve_ids("users", selector.ids, _user_query(selector), results)
+    requested = len(ids) + len(results)
+    for item_id, detail in (protected or {}).items():
+        ids = _exclude(ids, item_id, detail, results)
+    changed = await _apply("users", ids, projection, build_update, results, {"deleting": {"$ne": True}})
+    for user in changed:
+        user_profiles.invalidate(str(user["_id"]))
+    await after(changed)
+    return _summary(requested, results)
+
+@router.post("/users/role", response_model=BulkResult)
+async def bulk_change_role(data: BulkRoleChange, current_admin: dict = Depends(get_current_admin)):
+    """Change the role of many users (admin only)"""
+    now = datetime.utcnow()
+    
+    def build_update(user: dict) -> Optional[dict]:
+        if user.get("role") == data.newRole:
+            return None
+        return {"$set": {"role": data.newRole, "updatedAt": now}}
+    
+    async def after(changed: List[dict]) -> None:
+        # Outstanding access tokens carry the old role
+        await revoke_users_tokens([str(user["_id"]) for user in changed])
+    
+    # An admin demoting themselves could leave nobody able to undo it
+    protected = {} if data.newRole == UserRole.ADMIN else {current_admin["id"]: "Cannot change your own role"}
+    return await _bulk_users(data, {"role": 1}, build_update, after, protected)
+
+@router.post("/users/plan", response_model=BulkResult)
+async def bulk_change_plan(data: BulkPlanChange, current_admin: dict = Depends(get_current_admin)):
+    """Change the subscription plan of many users (admin only)"""
+    now = datetime.utcnow()
+    
+    def build_update(user: dict) -> Optional[dict]:
+        if user.get("subscription", {}).get("plan") == data.newPlan:
+            return None
+        return {"$set": {"subscription.plan": data.newPlan, "subscription.startDate": now, "updatedAt": now}}
+    
+    async def after(changed: List[dict]) -> None:
+        await stats.plans_changed(changed, data.newPlan)
+    
+    return await _bulk_users(data, {"subscription.plan": 1}, build_update, after)
+
+@router.post("/users/credits", response_model=BulkResult)
+async def bulk_grant_credits(data: BulkCreditGrant, current_admin: dict = Depends(get_current_admin)):
+    """Grant credits to many users (admin only)"""
+    now = datetime.utcnow()
+    
+    def build_update(user: dict) -> Optional[dict]:
+        return {"$inc": {"credits": data.amount}, "$set": {"updatedAt": now}}
+    
+    async def after(changed: List[dict]) -> None:
+        for user in changed:
+            transaction = CreditTransaction(
+                userId=str(user["_id"]),
+                amount=data.amount,
+                type="credit",
+                description=data.description,
+                metadata={"grantedBy": current_admin["id"]}
+            )
+            ledger.add(transaction.model_dump(by_alias=True, exclude={"id"}))
+    
+    return await _bulk_users(data, {"_id": 1}, build_update, after)
+
+@router.post("/users/delete", response_model=BulkResult)
+async def bulk_delete_users(data: UserSelector, current_admin: dict = Depends(get_current_admin)):
+    """Delete many users (admin only); each cascade runs as a background job"""
+    results: List[BulkItemResult] = []
+    ids = await _resolve_ids("users", data.ids, _user_query(data), results)
+    requested = len(ids) + len(results)
+    ids = _exclude(ids, current_admin["id"], "Cannot delete yourself", results)
+    
+    # Marking, token revocation and job creation are batched per chunk, not run per user
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        chunk = [str(user_id) for user_id in ids[start:start + BULK_CHUNK_SIZE]]
+        jobs = await deletion.start_user_deletions(chunk)
+        for user_id in chunk:
+            if user_id in jobs:
+                results.append(BulkItemResult(id=user_id, status="ok", jobId=jobs[user_id]))
+            else:
+                results.append(BulkItemResult(id=user_id, status="not_found"))
+    
+    return _summary(requested, results)
+
+async def _bulk_toggle(collection: str, data: CatalogSelector, query: Dict) -> BulkResult:
+    results: List[BulkItemResult] = []
+    ids = await _resolve_ids(collection, data.ids, query, results)
+    requested = len(ids) + len(results)
+    now = datetime.utcnow()
+    
+    def build_update(doc: dict) -> Optional[dict]:
+        if doc.get("enabled") == data.enabled:
+            return None
+        return {"$set": {"enabled": data.enabled, "updatedAt": now}}
+    
+    if await _apply(collection, ids, {"enabled": 1}, build_update, results):
+        await catalog.bump(collection)
+    return _summary(requested, results)
+
+@router.post("/models/enabled", response_model=BulkResult)
+async def bulk_toggle_models(data: CatalogSelector, current_admin: dict = Depends(get_current_admin)):
+    """Enable or disable many AI models (admin only)"""
+    return await _bulk_toggle("ai_models", data, {"provider": data.provider} if data.provider else {})
+
+@router.post("/mcp-tools/enabled", response_model=BulkResult)
+async def bulk_toggle_mcp_tools(data: CatalogSelector, current_admin: dict = Depends(get_current_admin)):
+    """Enable or disable many MCP tools (admin only)"""
+    return await _bulk_toggle("mcp_tools", data, {"type": data.type} if data.type else {})
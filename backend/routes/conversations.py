@@ -1,23 +1,88 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File
-from typing import List
-from models.conversation import Conversation, ConversationCreate, Message, MessageCreate, MessageRole
-from models.credits import CreditTransaction
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Set
+from models.conversation import Conversation, ConversationCreate, ConversationSettings, ConversationSummary, Message, MessageCreate, MessageRole
+from services import context, credits, deletion, message_store, metering
+from services.providers import get_provider
+from services.pubsub import hub, user_channel
+from services.response_cache import cache_key as response_cache_key, response_cache
+from services.rollups import rollups, user_plan
 from utils.auth import get_current_user
+from utils.etag import check_etag
+from utils.pagination import encode_cursor, keyset_filter, set_cursor_headers
 from database import db
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
+import asyncio
+import json
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 120
+
+# Strong references to detached tasks so they are not garbage-collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+SUMMARY_PROJECTION = {"projectName": 1, "updatedAt": 1, "messageCount": 1, "lastMessagePreview": 1}
+VERSION_PROJECTION = {"userId": 1, "deleting": 1, "updatedAt": 1, "messageCount": 1, "pinVersion": 1}
+
 router = APIRouter(prefix="/api/conversations", tags=["conversations"])
 
+async def _conversations_version(user_id: str) -> int:
+    """Counter bumped on every change to the user's conversation list; one _id lookup"""
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"conversationsVersion": 1})
+    return (user or {}).get("conversationsVersion", 0)
+
+async def _bump_conversations_version(user_id: str) -> None:
+    await db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"conversationsVersion": 1}})
+
 @router.get("/", response_model=List[Conversation])
-async def get_conversations(current_user: dict = Depends(get_current_user)):
+async def get_conversations(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all conversations for current user"""
-    conversations = await db.conversations.find({"userId": current_user["id"]}).sort("updatedAt", -1).to_list(1000)
+    not_modified = check_etag(request, response, "conversations", current_user["id"], await _conversations_version(current_user["id"]))
+    if not_modified:
+        return not_modified
+    
+    conversations = await db.conversations.find(
+        {"userId": current_user["id"], "deleting": {"$ne": True}}
+    ).sort("updatedAt", -1).to_list(1000)
     for conv in conversations:
         conv["_id"] = str(conv["_id"])
     return [Conversation(**conv) for conv in conversations]
 
+@router.get("/summary", response_model=List[ConversationSummary])
+async def get_conversation_summaries(
+    request: Request,
+    response: Response,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a page of lightweight conversation summaries, most recently updated first"""
+    version = await _conversations_version(current_user["id"])
+    not_modified = check_etag(request, response, "summary", current_user["id"], before, limit, version)
+    if not_modified:
+        return not_modified
+    
+    query = {"userId": current_user["id"], "deleting": {"$ne": True}, **keyset_filter("updatedAt", before, -1)}
+    conversations = await db.conversations.find(query, SUMMARY_PROJECTION) \
+        .sort([("updatedAt", -1), ("_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+    if conversations:
+        last = conversations[-1]
+        set_cursor_headers(response, next_cursor=encode_cursor(last["updatedAt"], last["_id"]), has_more=has_more)
+    else:
+        set_cursor_headers(response, has_more=False)
+    
+    for conv in conversations:
+        conv["_id"] = str(conv["_id"])
+    return [ConversationSummary(**conv) for conv in conversations]
+
 @router.post("/", response_model=Conversation)
 async def create_conversation(data: ConversationCreate, current_user: dict = Depends(get_current_user)):
     """Create a new conversation"""
@@ -29,127 +94,366 @@ async def create_conversation(data: ConversationCreate, current_user: dict = Dep
     
     conv_dict = conversation.model_dump(by_alias=True, exclude={"id"})
     result = await db.conversations.insert_one(conv_dict)
+    await _bump_conversations_version(current_user["id"])
     
     conv_dict["_id"] = str(result.inserted_id)
     return Conversation(**conv_dict)
 
 @router.get("/{conversation_id}", response_model=Conversation)
-async def get_conversation(conversation_id: str, current_user: dict = Depends(get_current_user)):
+async def get_conversation(conversation_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get a specific conversation"""
     try:
         conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid conversation ID")
     
-    if not conversation:
+    if not conversation or conversation.get("deleting"):
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     if conversation["userId"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    not_modified = check_etag(request, response, "conversation", conversation_id, conversation.get("updatedAt"), conversation.get("messageCount"))
+    if not_modified:
+        return not_modified
+    
     conversation["_id"] = str(conversation["_id"])
     return Conversation(**conversation)
 
 @router.get("/{conversation_id}/messages", response_model=List[Message])
-async def get_messages(conversation_id: str, current_user: dict = Depends(get_current_user)):
-    """Get all messages for a conversation"""
+async def get_messages(
+    conversation_id: str,
+    request: Request,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a page of messages for a conversation (latest messages when no cursor is given)"""
     # Verify conversation ownership
-    try:
-        conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid conversation ID")
+    conversation = await _get_owned_conversation(conversation_id, current_user, VERSION_PROJECTION)
     
-    if not conversation or conversation["userId"] != current_user["id"]:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    # Every message write bumps the conversation's updatedAt and messageCount, every pin change its pinVersion
+    not_modified = check_etag(
+        request, response, "messages", conversation_id, before, after, limit,
+        conversation.get("updatedAt"), conversation.get("messageCount"), conversation.get("pinVersion", 0)
+    )
+    if not_modified:
+        return not_modified
+    
+    messages, has_more = await message_store.fetch_page(conversation_id, before=before, after=after, limit=limit)
+    if messages:
+        set_cursor_headers(
+            response,
+            next_cursor=encode_cursor(messages[-1]["timestamp"], messages[-1]["_id"]),
+            prev_cursor=encode_cursor(messages[0]["timestamp"], messages[0]["_id"]),
+            has_more=has_more
+        )
+    else:
+        set_cursor_headers(response, has_more=False)
     
-    messages = await db.messages.find({"conversationId": conversation_id}).sort("timestamp", 1).to_list(1000)
     for msg in messages:
         msg["_id"] = str(msg["_id"])
     return [Message(**msg) for msg in messages]
 
-@router.post("/messages", response_model=Message)
-async def send_message(data: MessageCreate, current_user: dict = Depends(get_current_user)):
-    """Send a message in a conversation"""
-    # Verify conversation ownership
+async def _get_owned_conversation(conversation_id: str, current_user: dict, projection: Optional[dict] = None) -> dict:
+    """Load a conversation and verify the current user owns it"""
     try:
-        conversation = await db.conversations.find_one({"_id": ObjectId(data.conversationId)})
+        conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)}, projection)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid conversation ID")
     
     if not conversation or conversation["userId"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Check user credits
-    user = await db.users.find_one({"_id": ObjectId(current_user["id"])})
-    if user.get("credits", 0) < 0.1:
-        raise HTTPException(status_code=402, detail="Insufficient credits")
+    if conversation.get("deleting"):
+        raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Create user message
-    user_message = Message(
-        conversationId=data.conversationId,
-        role=MessageRole.USER,
-        content=data.content,
-        attachments=data.attachments
-    )
+    return conversation
+
+async def _set_pinned(conversation_id: str, message_id: str, pinned: bool, current_user: dict) -> Message:
+    """Pin or unpin a live message; pinned messages always go into the model's context"""
+    await _get_owned_conversation(conversation_id, current_user, {"userId": 1, "deleting": 1})
+    if not ObjectId.is_valid(message_id):
+        raise HTTPException(status_code=400, detail="Invalid message ID")
     
-    msg_dict = user_message.model_dump(by_alias=True, exclude={"id"})
-    result = await db.messages.insert_one(msg_dict)
-    msg_dict["_id"] = str(result.inserted_id)
+    # Compacted history lives in blocks and cannot be pinned
+    message = await db.messages.find_one_and_update(
+        {"_id": ObjectId(message_id), "conversationId": conversation_id},
+        {"$set": {"metadata.pinned": True}} if pinned else {"$unset": {"metadata.pinned": ""}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    await db.conversations.update_one({"_id": ObjectId(conversation_id)}, {"$inc": {"pinVersion": 1}})
     
-    # Update conversation settings if provided
-    if data.settings:
+    message["_id"] = str(message["_id"])
+    await hub.publish(
+        user_channel(current_user["id"]),
+        "message.pinned" if pinned else "message.unpinned",
+        {"messageId": message["_id"]},
+        conversationId=conversation_id
+    )
+    return Message(**message)
+
+@router.put("/{conversation_id}/messages/{message_id}/pin", response_model=Message)
+async def pin_message(conversation_id: str, message_id: str, current_user: dict = Depends(get_current_user)):
+    """Pin a message so it is always included in the conversation's context"""
+    return await _set_pinned(conversation_id, message_id, True, current_user)
+
+@router.delete("/{conversation_id}/messages/{message_id}/pin", response_model=Message)
+async def unpin_message(conversation_id: str, message_id: str, current_user: dict = Depends(get_current_user)):
+    """Unpin a message"""
+    return await _set_pinned(conversation_id, message_id, False, current_user)
+
+async def _touch_conversation(
+    conversation_id: str,
+    content: str,
+    extra: Optional[dict] = None,
+    credits_used: float = 0.0
+) -> None:
+    """Keep the denormalized conversation summary current after a message write.
+
+    The list version is bumped once per turn by the caller, not on every message write.
+    """
+    update = {
+        "lastMessagePreview": content[:PREVIEW_LENGTH],
+        "updatedAt": datetime.utcnow(),
+        **(extra or {})
+    }
+    inc = {"messageCount": 1}
+    if credits_used:
+        inc["creditsUsed"] = credits_used
+    result = await db.conversations.update_one(
+        {"_id": ObjectId(conversation_id), "messageCount": {"$exists": True}},
+        {"$set": update, "$inc": inc}
+    )
+    if result.matched_count == 0:
+        # Created before summaries were kept: count from history, which already holds this message
+        summary = await message_store.summarize(conversation_id, PREVIEW_LENGTH)
+        inc.pop("messageCount")
         await db.conversations.update_one(
-            {"_id": ObjectId(data.conversationId)},
-            {"$set": {"settings": data.settings.model_dump(), "updatedAt": datetime.utcnow()}}
+            {"_id": ObjectId(conversation_id)},
+            {"$set": {**update, "messageCount": summary["messageCount"]}, **({"$inc": inc} if inc else {})}
+        )
+
+async def _start_turn(data: MessageCreate, current_user: dict) -> dict:
+    """Validate a send request, reserve credits and store the user message"""
+    conversation = await _get_owned_conversation(data.conversationId, current_user)
+    settings = data.settings or ConversationSettings(**(conversation.get("settings") or {}))
+    pricing = await metering.get_model_pricing(settings.model)
+    
+    # History is selected before the new message is stored, leaving room for it in the budget
+    content_tokens = metering.count_tokens(data.content)
+    budget = context.context_budget(settings.maxTokens, pricing) - content_tokens
+    history, history_tokens = await context.assemble_context(data.conversationId, max(budget, 0))
+    prompt = history + [{"role": MessageRole.USER.value, "content": data.content}]
+    prompt_tokens = history_tokens + content_tokens
+    
+    # A first-turn prompt can be answered from the response cache, skipping the provider and the charge.
+    # The key covers only the text, so prompts with attachments always go to the provider
+    cache_key = None
+    cached = None
+    if settings.cacheResponses and not history and not data.attachments:
+        cache_key = response_cache_key(data.content, settings)
+        cached = await response_cache.get(cache_key)
+    
+    # Hold the turn's worst-case cost up front; one conditional update, no balance read
+    reserved = None
+    if cached is None:
+        reserved = await credits.reserve(
+            current_user["id"],
+            metering.estimate_turn_cost(prompt_tokens, settings.maxTokens, pricing)
+        )
+    
+    try:
+        # Create user message
+        user_message = Message(
+            conversationId=data.conversationId,
+            userId=current_user["id"],
+            role=MessageRole.USER,
+            content=data.content,
+            attachments=data.attachments,
+            metadata={"tokens": content_tokens}
+        )
+        
+        msg_dict = user_message.model_dump(by_alias=True, exclude={"id"})
+        result = await db.messages.insert_one(msg_dict)
+        msg_dict["_id"] = str(result.inserted_id)
+        
+        # Update the conversation summary (and settings if provided)
+        await _touch_conversation(
+            data.conversationId,
+            data.content,
+            {"settings": data.settings.model_dump()} if data.settings else None
         )
+    except Exception:
+        await credits.release(current_user["id"], reserved)
+        raise
+    
+    channel = user_channel(current_user["id"])
+    await hub.publish(channel, "message.created", msg_dict, conversationId=data.conversationId)
+    if data.settings:
+        await hub.publish(channel, "conversation.settings", data.settings, conversationId=data.conversationId)
+    
+    return {
+        "message": msg_dict,
+        "settings": settings,
+        "pricing": pricing,
+        "prompt": prompt,
+        "promptTokens": prompt_tokens,
+        "reserved": reserved,
+        "cacheKey": cache_key,
+        "cached": cached
+    }
+
+async def _abandon_turn(current_user: dict, turn: dict) -> None:
+    """Release a turn that gets no reply; its user message already changed the conversation list"""
+    await credits.release(current_user["id"], turn["reserved"])
+    await _bump_conversations_version(current_user["id"])
+
+async def _finish_turn(
+    data: MessageCreate,
+    current_user: dict,
+    turn: dict,
+    content: str,
+    metadata: Optional[dict] = None
+) -> dict:
+    """Store the assistant reply and settle the turn's credit reservation"""
+    completion_tokens = metering.count_tokens(content)
+    usage = metering.meter_turn(turn["promptTokens"], completion_tokens, turn["pricing"])
+    if turn["cached"] is not None:
+        usage.update(credits=0.0, cached=True)
     
-    # Mock AI response for now
     ai_response = Message(
         conversationId=data.conversationId,
+        userId=current_user["id"],
         role=MessageRole.ASSISTANT,
-        content=f"I understand you want to build: {data.content[:100]}... I'm processing your request with the selected model and settings."
+        content=content,
+        metadata={**(metadata or {}), "tokens": completion_tokens, "usage": usage}
     )
     
-    ai_dict = ai_response.model_dump(by_alias=True, exclude={"id"})
-    ai_result = await db.messages.insert_one(ai_dict)
-    
-    # Deduct credits (mock calculation)
-    credits_used = 0.5
-    await db.users.update_one(
-        {"_id": ObjectId(current_user["id"])},
-        {
-            "$inc": {"credits": -credits_used, "totalCreditsUsed": credits_used},
-            "$set": {"updatedAt": datetime.utcnow()}
-        }
-    )
+    try:
+        ai_dict = ai_response.model_dump(by_alias=True, exclude={"id"})
+        ai_result = await db.messages.insert_one(ai_dict)
+        ai_dict["_id"] = str(ai_result.inserted_id)
+        await _touch_conversation(data.conversationId, content, credits_used=usage["credits"])
+    except Exception:
+        await _abandon_turn(current_user, turn)
+        raise
+    await _bump_conversations_version(current_user["id"])
     
-    # Log credit transaction
-    transaction = CreditTransaction(
-        userId=current_user["id"],
-        amount=-credits_used,
-        type="debit",
-        description="Message sent",
-        conversationId=data.conversationId
+    await credits.settle(
+        current_user["id"],
+        turn["reserved"],
+        usage["credits"],
+        conversation_id=data.conversationId,
+        metadata={"usage": usage}
     )
-    await db.credit_transactions.insert_one(transaction.model_dump(by_alias=True, exclude={"id"}))
+    await hub.publish(user_channel(current_user["id"]), "message.created", ai_dict, conversationId=data.conversationId)
+    rollups.record(
+        "turns",
+        ai_response.timestamp,
+        {"model": usage["model"], "plan": await user_plan(current_user["id"])},
+        tokens=usage["totalTokens"],
+        credits=usage["credits"]
+    )
+    
+    if turn["cacheKey"] and turn["cached"] is None and not metadata:
+        await response_cache.set(turn["cacheKey"], content)
     
-    return Message(**msg_dict)
+    return ai_dict
 
-@router.delete("/{conversation_id}")
-async def delete_conversation(conversation_id: str, current_user: dict = Depends(get_current_user)):
-    """Delete a conversation"""
-    try:
-        conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid conversation ID")
+def _log_task_failure(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error("Background task failed", exc_info=task.exception())
+
+def _spawn(coro) -> asyncio.Task:
+    """Run a coroutine detached from the request, keeping it alive and logging failures"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_log_task_failure)
+    return task
+
+def _sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.post("/messages", response_model=Message)
+async def send_message(data: MessageCreate, current_user: dict = Depends(get_current_user)):
+    """Send a message in a conversation"""
+    turn = await _start_turn(data, current_user)
     
-    if not conversation or conversation["userId"] != current_user["id"]:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    content = turn["cached"]
+    if content is None:
+        try:
+            content = await get_provider().complete(turn["prompt"], turn["settings"])
+        except Exception:
+            await _abandon_turn(current_user, turn)
+            raise
+    await _finish_turn(data, current_user, turn, content)
+    
+    return Message(**turn["message"])
+
+@router.post("/messages/stream")
+async def stream_message(data: MessageCreate, current_user: dict = Depends(get_current_user)):
+    """Send a message and stream the assistant reply as Server-Sent Events"""
+    turn = await _start_turn(data, current_user)
+    provider = get_provider()
     
-    # Delete all messages
-    await db.messages.delete_many({"conversationId": conversation_id})
+    async def generate():
+        if turn["cached"] is not None:
+            yield turn["cached"]
+            return
+        async for delta in provider.stream(turn["prompt"], turn["settings"]):
+            yield delta
+    
+    async def event_stream():
+        yield _sse("message", turn["message"])
+        
+        parts = []
+        finished = False
+        try:
+            async for delta in generate():
+                parts.append(delta)
+                yield _sse("token", {"content": delta})
+            
+            finished = True
+            ai_dict = await _finish_turn(data, current_user, turn, "".join(parts))
+            yield _sse("done", ai_dict)
+        except Exception as exc:
+            if finished:
+                raise
+            finished = True
+            logger.exception("Streaming provider failed")
+            if parts:
+                ai_dict = await _finish_turn(data, current_user, turn, "".join(parts), {"error": str(exc)})
+                yield _sse("error", {"detail": "Response generation failed", "message": ai_dict})
+            else:
+                await _abandon_turn(current_user, turn)
+                yield _sse("error", {"detail": "Response generation failed"})
+        finally:
+            if not finished:
+                # Client went away mid-stream; persist what was generated without blocking the cancelled response
+                _spawn(_finish_turn(data, current_user, turn, "".join(parts), {"interrupted": True}))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/{conversation_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_conversation(conversation_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete a conversation; its messages are removed in the background"""
+    await _get_owned_conversation(conversation_id, current_user)
     
-    # Delete conversation
-    await db.conversations.delete_one({"_id": ObjectId(conversation_id)})
+    # Hide it immediately, then let the deletion worker remove messages and compacted history
+    await db.conversations.update_one({"_id": ObjectId(conversation_id)}, {"$set": {"deleting": True}})
+    await _bump_conversations_version(current_user["id"])
+    job_id = await deletion.enqueue("conversation", conversation_id, current_user["id"])
+    await hub.publish(user_channel(current_user["id"]), "conversation.deleted", conversationId=conversation_id)
     
-    return {"message": "Conversation deleted successfully"}
\ No newline at end of file
+    return {"message": "Conversation deletion started", "jobId": job_id}
\ No newline at end of file
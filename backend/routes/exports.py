@@ -0,0 +1,180 @@
+from fastapi import APIRouter, HTTPException, Query, Request, status, Depends
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Optional
+from enum import Enum
+from utils.auth import get_current_admin
+from bson import ObjectId
+from datetime import datetime
+from database import db
+import csv
+import io
+import json
+import os
+
+router = APIRouter(prefix="/api/admin/exports", tags=["admin"])
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+ROWS_PER_CHUNK = 500
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+# Per dataset: collection, time field for since/until (and export order), exportable
+# fields (all of them unless ?fields= narrows the selection) and the query parameters
+# it can be filtered on.
+# Password hashes and other secrets are deliberately absent from every field list.
+DATASETS = {
+    "users": {
+        "collection": "users",
+        "timeField": "createdAt",
+        "fields": ["_id", "email", "name", "role", "provider", "subscription.plan", "subscription.status",
+                   "credits", "totalCreditsUsed", "createdAt", "lastLogin"],
+        "filters": {"role": "role", "plan": "subscription.plan", "provider": "provider"},
+        "base": {"deleting": {"$ne": True}},
+    },
+    "projects": {
+        "collection": "projects",
+        "timeField": "createdAt",
+        "fields": ["_id", "userId", "name", "type", "status", "url", "createdAt", "updatedAt", "description"],
+        "filters": {"user_id": "userId", "status": "status", "type": "type"},
+        "base": {},
+    },
+    "activities": {
+        "collection": "activities",
+        "timeField": "timestamp",
+        "fields": ["_id", "userId", "action", "resource", "timestamp", "metadata"],
+        "filters": {"user_id": "userId", "action": "action", "resource": "resource"},
+        "base": {},
+    },
+    "credit-transactions": {
+        "collection": "credit_transactions",
+        "timeField": "timestamp",
+        "fields": ["_id", "userId", "amount", "type", "description", "conversationId", "timestamp", "metadata"],
+        "filters": {"user_id": "userId", "type": "type", "conversation_id": "conversationId"},
+        "base": {},
+    },
+}
+
+RESERVED_PARAMS = {"format", "fields", "since", "until"}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return str(value)
+
+def _lookup(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default, separators=(",", ":"))
+    if isinstance(value, Enum):
+        return str(value.value)
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value)
+    # Spreadsheets evaluate cells starting with these as formulas
+    if text.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+def _csv_chunk(rows: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+async def _stream(
+    collection: str,
+    query: Dict,
+    time_field: str,
+    fields: List[str],
+    export_format: ExportFormat
+) -> AsyncIterator[str]:
+    """Yield the export in chunks; only one cursor batch is held in memory at a time"""
+    projection = {field: 1 for field in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    # Every dataset has a (timeField, _id) index, so a since/until range is an index scan with no in-memory sort
+    cursor = db[collection].find(query, projection).sort([(time_field, 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    
+    if export_format == ExportFormat.CSV:
+        yield _csv_chunk([fields])
+    
+    rows = []
+    async for doc in cursor:
+        if export_format == ExportFormat.CSV:
+            rows.append([_csv_value(_lookup(doc, field)) for field in fields])
+        else:
+            rows.append(json.dumps(doc, default=_json_default, separators=(",", ":")))
+        if len(rows) >= ROWS_PER_CHUNK:
+            yield _csv_chunk(rows) if export_format == ExportFormat.CSV else "\n".join(rows) + "\n"
+            rows = []
+    if rows:
+        yield _csv_chunk(rows) if export_format == ExportFormat.CSV else "\n".join(rows) + "\n"
+
+@router.get("/{dataset}")
+async def export_dataset(
+    dataset: str,
+    request: Request,
+    format: ExportFormat = ExportFormat.NDJSON,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Stream a full export of users, projects, activities or credit-transactions (admin only)
+
+    Extra query parameters filter on the dataset's filterable fields, e.g. ?user_id=...&type=debit.
+    """
+    spec = DATASETS.get(dataset)
+    if not spec:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown export. Available: {', '.join(DATASETS)}"
+        )
+    
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else spec["fields"]
+    unknown = [field for field in selected if field not in spec["fields"]]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Fields must be chosen from: {', '.join(spec['fields'])}"
+        )
+    
+    query = dict(spec["base"])
+    for param, value in request.query_params.items():
+        if param in RESERVED_PARAMS:
+            continue
+        if param not in spec["filters"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported filter '{param}'. Available: {', '.join(spec['filters'])}"
+            )
+        query[spec["filters"][param]] = value
+    time_range = {}
+    if since:
+        time_range["$gte"] = since
+    if until:
+        time_range["$lt"] = until
+    if time_range:
+        query[spec["timeField"]] = time_range
+    
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d%H%M%S}.{format.value}"
+    return StreamingResponse(
+        _stream(spec["collection"], query, spec["timeField"], selected, format),
+        media_type="text/csv" if format == ExportFormat.CSV else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
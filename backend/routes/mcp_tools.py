@@ -1,28 +1,46 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, Response, status, Depends
 from typing import List
+from pydantic import TypeAdapter
 from models.mcp_tool import MCPTool, MCPToolCreate, UserMCPConfig
+from services.catalog import MCP_TOOLS, catalog
 from utils.auth import get_current_user, get_current_admin
+from utils.etag import check_etag
 from database import db
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter(prefix="/api/mcp-tools", tags=["mcp-tools"])
 
+_tool_list = TypeAdapter(List[MCPTool])
+
+def _serialized(query: dict):
+    """Build the JSON body for a tool listing, validated once per catalog version"""
+    async def build() -> bytes:
+        tools = await db.mcp_tools.find(query).to_list(1000)
+        for tool in tools:
+            tool["_id"] = str(tool["_id"])
+        return _tool_list.dump_json([MCPTool(**tool) for tool in tools], by_alias=True)
+    return build
+
 @router.get("/", response_model=List[MCPTool])
-async def get_mcp_tools(current_user: dict = Depends(get_current_user)):
+async def get_mcp_tools(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all enabled MCP tools"""
-    tools = await db.mcp_tools.find({"enabled": True}).to_list(1000)
-    for tool in tools:
-        tool["_id"] = str(tool["_id"])
-    return [MCPTool(**tool) for tool in tools]
+    not_modified = check_etag(request, response, "mcp-tools", "enabled", await catalog.version(MCP_TOOLS))
+    if not_modified:
+        return not_modified
+    
+    body = await catalog.get(MCP_TOOLS, "enabled", _serialized({"enabled": True}))
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
 
 @router.get("/all", response_model=List[MCPTool])
-async def get_all_mcp_tools(current_admin: dict = Depends(get_current_admin)):
+async def get_all_mcp_tools(request: Request, response: Response, current_admin: dict = Depends(get_current_admin)):
     """Get all MCP tools (admin only)"""
-    tools = await db.mcp_tools.find().to_list(1000)
-    for tool in tools:
-        tool["_id"] = str(tool["_id"])
-    return [MCPTool(**tool) for tool in tools]
+    not_modified = check_etag(request, response, "mcp-tools", "all", await catalog.version(MCP_TOOLS))
+    if not_modified:
+        return not_modified
+    
+    body = await catalog.get(MCP_TOOLS, "all", _serialized({}))
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
 
 @router.post("/", response_model=MCPTool)
 async def create_mcp_tool(data: MCPToolCreate, current_admin: dict = Depends(get_current_admin)):
@@ -30,6 +48,7 @@ async def create_mcp_tool(data: MCPToolCreate, current_admin: dict = Depends(get
     tool = MCPTool(**data.model_dump())
     tool_dict = tool.model_dump(by_alias=True, exclude={"id"})
     result = await db.mcp_tools.insert_one(tool_dict)
+    await catalog.bump(MCP_TOOLS)
     tool_dict["_id"] = str(result.inserted_id)
     return MCPTool(**tool_dict)
 
@@ -46,6 +65,7 @@ async def toggle_mcp_tool(tool_id: str, enabled: bool, current_admin: dict = Dep
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Tool not found")
+    await catalog.bump(MCP_TOOLS)
     
     return {"message": f"Tool {'enabled' if enabled else 'disabled'} successfully"}
 
@@ -59,6 +79,7 @@ async def delete_mcp_tool(tool_id: str, current_admin: dict = Depends(get_curren
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Tool not found")
+    await catalog.bump(MCP_TOOLS)
     
     return {"message": "Tool deleted successfully"}
 
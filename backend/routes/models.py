@@ -1,28 +1,46 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, Response, status, Depends
 from typing import List
+from pydantic import TypeAdapter
 from models.ai_model import AIModel, ModelCreate, ModelUpdate
+from services.catalog import MODELS, catalog
 from utils.auth import get_current_user, get_current_admin
+from utils.etag import check_etag
 from database import db
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter(prefix="/api/models", tags=["models"])
 
+_model_list = TypeAdapter(List[AIModel])
+
+def _serialized(query: dict):
+    """Build the JSON body for a model listing, validated once per catalog version"""
+    async def build() -> bytes:
+        models = await db.ai_models.find(query).to_list(1000)
+        for model in models:
+            model["_id"] = str(model["_id"])
+        return _model_list.dump_json([AIModel(**model) for model in models], by_alias=True)
+    return build
+
 @router.get("/", response_model=List[AIModel])
-async def get_models(current_user: dict = Depends(get_current_user)):
+async def get_models(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all enabled AI models"""
-    models = await db.ai_models.find({"enabled": True}).to_list(1000)
-    for model in models:
-        model["_id"] = str(model["_id"])
-    return [AIModel(**model) for model in models]
+    not_modified = check_etag(request, response, "models", "enabled", await catalog.version(MODELS))
+    if not_modified:
+        return not_modified
+    
+    body = await catalog.get(MODELS, "enabled", _serialized({"enabled": True}))
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
 
 @router.get("/all", response_model=List[AIModel])
-async def get_all_models(current_admin: dict = Depends(get_current_admin)):
+async def get_all_models(request: Request, response: Response, current_admin: dict = Depends(get_current_admin)):
     """Get all AI models (admin only)"""
-    models = await db.ai_models.find().to_list(1000)
-    for model in models:
-        model["_id"] = str(model["_id"])
-    return [AIModel(**model) for model in models]
+    not_modified = check_etag(request, response, "models", "all", await catalog.version(MODELS))
+    if not_modified:
+        return not_modified
+    
+    body = await catalog.get(MODELS, "all", _serialized({}))
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
 
 @router.post("/", response_model=AIModel)
 async def create_model(data: ModelCreate, current_admin: dict = Depends(get_current_admin)):
@@ -30,6 +48,7 @@ async def create_model(data: ModelCreate, current_admin: dict = Depends(get_curr
     model = AIModel(**data.model_dump())
     model_dict = model.model_dump(by_alias=True, exclude={"id"})
     result = await db.ai_models.insert_one(model_dict)
+    await catalog.bump(MODELS)
     model_dict["_id"] = str(result.inserted_id)
     return AIModel(**model_dict)
 
@@ -53,6 +72,7 @@ async def update_model(
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Model not found")
+    await catalog.bump(MODELS)
     
     model = await db.ai_models.find_one({"_id": ObjectId(model_id)})
     model["_id"] = str(model["_id"])
@@ -68,5 +88,6 @@ async def delete_model(model_id: str, current_admin: dict = Depends(get_current_
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Model not found")
+    await catalog.bump(MODELS)
     
     return {"message": "Model deleted successfully"}
\ No newline at end of file
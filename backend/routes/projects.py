@@ -1,17 +1,33 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, Response, status, Depends
 from typing import List
 from models.project import Project, ProjectCreate, ProjectUpdate, ProjectStatus
-from models.activity import ActivityCreate
+from services import stats
+from services.activity_log import log_activity
+from services.pubsub import hub, user_channel
+from services.user_cache import user_profiles
 from utils.auth import get_current_user
+from utils.etag import check_etag
 from bson import ObjectId
 from datetime import datetime
 from database import db
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
+async def _projects_version(user_id: str) -> int:
+    """Counter bumped on every change to the user's projects; one _id lookup"""
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"projectsVersion": 1})
+    return (user or {}).get("projectsVersion", 0)
+
+async def _bump_projects_version(user_id: str) -> None:
+    await db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"projectsVersion": 1}})
+
 @router.get("/", response_model=List[Project])
-async def get_user_projects(current_user: dict = Depends(get_current_user)):
+async def get_user_projects(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all projects for the current user"""
+    not_modified = check_etag(request, response, "projects", current_user["id"], await _projects_version(current_user["id"]))
+    if not_modified:
+        return not_modified
+    
     projects = await db.projects.find({"userId": current_user["id"]}).to_list(1000)
     for project in projects:
         project["_id"] = str(project["_id"])
@@ -21,7 +37,7 @@ async def get_user_projects(current_user: dict = Depends(get_current_user)):
 async def create_project(project_data: ProjectCreate, current_user: dict = Depends(get_current_user)):
     """Create a new project"""
     # Check user's subscription limits
-    user = await db.users.find_one({"_id": ObjectId(current_user["id"])})
+    user = await user_profiles.get(current_user["id"]) or {}
     user_projects = await db.projects.count_documents({"userId": current_user["id"]})
     
     subscription_limits = {
@@ -50,15 +66,11 @@ async def create_project(project_data: ProjectCreate, current_user: dict = Depen
     
     project_dict = project.model_dump(by_alias=True, exclude={"id"})
     result = await db.projects.insert_one(project_dict)
+    await stats.bump({"projects.total": 1, f"projects.{ProjectStatus.DRAFT.value}": 1})
+    await _bump_projects_version(current_user["id"])
     
     # Log activity
-    activity = ActivityCreate(
-        userId=current_user["id"],
-        action="create",
-        resource="project",
-        metadata={"projectId": str(result.inserted_id), "projectName": project.name}
-    )
-    await db.activities.insert_one(activity.model_dump())
+    await log_activity(current_user["id"], "create", "project", {"projectId": str(result.inserted_id), "projectName": project.name})
     
     project_dict["_id"] = str(result.inserted_id)
     return Project(**project_dict)
@@ -125,18 +137,16 @@ async def update_project(
         {"_id": ObjectId(project_id)},
         {"$set": update_data}
     )
+    if "status" in update_data:
+        await stats.project_status_changed(project.get("status"), update_data["status"])
+    await _bump_projects_version(current_user["id"])
     
     # Log activity
-    activity = ActivityCreate(
-        userId=current_user["id"],
-        action="update",
-        resource="project",
-        metadata={"projectId": project_id, "updates": update_data}
-    )
-    await db.activities.insert_one(activity.model_dump())
+    await log_activity(current_user["id"], "update", "project", {"projectId": project_id, "updates": update_data})
     
     updated_project = await db.projects.find_one({"_id": ObjectId(project_id)})
     updated_project["_id"] = str(updated_project["_id"])
+    await hub.publish(user_channel(current_user["id"]), "project.updated", updated_project, projectId=project_id)
     return Project(**updated_project)
 
 @router.delete("/{project_id}")
@@ -162,16 +172,13 @@ async def delete_project(project_id: str, current_user: dict = Depends(get_curre
             detail="Not authorized to delete this project"
         )
     
-    await db.projects.delete_one({"_id": ObjectId(project_id)})
+    result = await db.projects.delete_one({"_id": ObjectId(project_id)})
+    if result.deleted_count:
+        await stats.projects_removed([project])
+        await _bump_projects_version(current_user["id"])
     
     # Log activity
-    activity = ActivityCreate(
-        userId=current_user["id"],
-        action="delete",
-        resource="project",
-        metadata={"projectId": project_id, "projectName": project.get("name")}
-    )
-    await db.activities.insert_one(activity.model_dump())
+    await log_activity(current_user["id"], "delete", "project", {"projectId": project_id, "projectName": project.get("name")})
     
     return {"message": "Project deleted successfully"}
 
@@ -209,15 +216,18 @@ async def deploy_project(project_id: str, current_user: dict = Depends(get_curre
             "updatedAt": datetime.utcnow()
         }}
     )
+    await stats.project_status_changed(project.get("status"), ProjectStatus.DEPLOYED)
+    await _bump_projects_version(current_user["id"])
     
     # Log activity
-    activity = ActivityCreate(
-        userId=current_user["id"],
-        action="deploy",
-        resource="project",
-        metadata={"projectId": project_id, "url": deployment_url}
+    await log_activity(current_user["id"], "deploy", "project", {"projectId": project_id, "url": deployment_url})
+    
+    await hub.publish(
+        user_channel(current_user["id"]),
+        "project.status",
+        {"status": ProjectStatus.DEPLOYED, "url": deployment_url},
+        projectId=project_id
     )
-    await db.activities.insert_one(activity.model_dump())
     
     return {
         "message": "Project deployed successfully",
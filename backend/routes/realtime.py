@@ -0,0 +1,67 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, status
+from services.pubsub import hub, user_channel
+from utils.auth import decode_token
+import asyncio
+import os
+import time
+
+router = APIRouter(prefix="/api", tags=["realtime"])
+
+AUTH_CHECK_SECONDS = float(os.getenv("WS_AUTH_CHECK_SECONDS", "15"))
+MIN_AUTH_CHECK_SECONDS = 1.0
+
+@router.websocket("/ws")
+async def updates_socket(websocket: WebSocket, token: str):
+    """Push conversation and project updates for the authenticated user"""
+    # Browsers cannot set headers on a WebSocket handshake, so the token comes in the query string
+    try:
+        payload = decode_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    user_id = payload.get("sub")
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    subscription = hub.subscribe([user_channel(user_id)])
+    
+    async def receive():
+        # Only pings are expected from the client; this also notices disconnects
+        while True:
+            message = await websocket.receive_text()
+            if message == "ping":
+                await websocket.send_text("pong")
+    
+    async def send():
+        while True:
+            event = await subscription.get()
+            await websocket.send_json(event)
+    
+    async def watch_token():
+        # The token is only verified at connect; re-check it so revocation or expiry ends the socket
+        while True:
+            delay = AUTH_CHECK_SECONDS
+            if "exp" in payload:
+                delay = min(delay, payload["exp"] - time.time())
+            await asyncio.sleep(max(delay, MIN_AUTH_CHECK_SECONDS))
+            try:
+                decode_token(token)
+            except HTTPException:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+    
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send()), asyncio.create_task(watch_token())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # A disconnect ends the socket normally; anything else should surface
+            exc = task.exception()
+            if exc and not isinstance(exc, WebSocketDisconnect):
+                raise exc
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
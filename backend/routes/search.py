@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List
+from models.search import ConversationHit, MessageHit, SearchResults
+from services.message_store import block_messages
+from utils.auth import get_current_user
+from database import db
+import html
+import re
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+SNIPPET_LENGTH = 160
+MAX_CONVERSATION_HITS = 5
+
+def _query_terms(q: str) -> List[str]:
+    """Positive search terms, without quotes and negations"""
+    return [term for term in re.findall(r'-?[\w]+', q) if not term.startswith("-")]
+
+def _term_pattern(terms: List[str]):
+    """Text search stems words, so match anything starting with a term"""
+    return re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE)
+
+def _snippet(content: str, terms: List[str]) -> str:
+    """Cut a window of text around the first match and wrap matches in <mark>"""
+    if not terms:
+        return html.escape(content[:SNIPPET_LENGTH])
+    
+    pattern = _term_pattern(terms)
+    match = pattern.search(content)
+    start = max(match.start() - SNIPPET_LENGTH // 3, 0) if match else 0
+    window = content[start:start + SNIPPET_LENGTH]
+    
+    parts = []
+    last = 0
+    for m in pattern.finditer(window):
+        parts.append(html.escape(window[last:m.start()]))
+        parts.append(f"<mark>{html.escape(m.group(0))}</mark>")
+        last = m.end()
+    parts.append(html.escape(window[last:]))
+    
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + SNIPPET_LENGTH < len(content) else ""
+    return prefix + "".join(parts) + suffix
+
+async def _compacted_hits(user_id: str, q: str, terms: List[str], limit: int, excluded: List[str]) -> List[dict]:
+    """Matching messages from compacted blocks, each scored with its block's score"""
+    if not terms:
+        return []
+    
+    blocks = await db.message_blocks.find(
+        {"userId": user_id, "$text": {"$search": q}, "conversationId": {"$nin": excluded}},
+        {"score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(limit)
+    
+    pattern = _term_pattern(terms)
+    hits = []
+    for block in blocks:
+        for msg in await block_messages(block):
+            if pattern.search(msg.get("content", "")):
+                hits.append({**msg, "score": block["score"]})
+                if len(hits) >= limit:
+                    return hits
+    return hits
+
+@router.get("/", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search the current user's conversations and messages"""
+    terms = _query_terms(q)
+    score = {"score": {"$meta": "textScore"}}
+    
+    # Every text index is prefixed by userId, so each lookup stays inside the tenant.
+    # Hits come from live messages and from compacted blocks; take enough of each to fill the page
+    wanted = offset + limit + 1
+    # Conversations pending deletion keep their messages until the background job reaches them
+    deleting = [str(conv_id) for conv_id in await db.conversations.distinct(
+        "_id", {"userId": current_user["id"], "deleting": True}
+    )]
+    messages = await db.messages.find(
+        {"userId": current_user["id"], "$text": {"$search": q}, "conversationId": {"$nin": deleting}},
+        {**score, "conversationId": 1, "role": 1, "timestamp": 1, "content": 1}
+    ).sort([("score", {"$meta": "textScore"})]).limit(wanted).to_list(wanted)
+    messages += await _compacted_hits(current_user["id"], q, terms, wanted, deleting)
+    messages.sort(key=lambda msg: msg["score"], reverse=True)
+    messages = messages[offset:offset + limit + 1]
+    
+    has_more = len(messages) > limit
+    message_hits = [
+        MessageHit(
+            _id=str(msg["_id"]),
+            conversationId=msg["conversationId"],
+            role=msg["role"],
+            timestamp=msg["timestamp"],
+            score=msg["score"],
+            snippet=_snippet(msg["content"], terms)
+        )
+        for msg in messages[:limit]
+    ]
+    
+    conversation_hits = []
+    if offset == 0:
+        conversations = await db.conversations.find(
+            {"userId": current_user["id"], "$text": {"$search": q}, "deleting": {"$ne": True}},
+            {**score, "projectName": 1, "updatedAt": 1}
+        ).sort([("score", {"$meta": "textScore"})]).limit(MAX_CONVERSATION_HITS).to_list(MAX_CONVERSATION_HITS)
+        for conv in conversations:
+            conv["_id"] = str(conv["_id"])
+        conversation_hits = [ConversationHit(**conv) for conv in conversations]
+    
+    return SearchResults(
+        query=q,
+        conversations=conversation_hits,
+        messages=message_hits,
+        offset=offset,
+        hasMore=has_more
+    )
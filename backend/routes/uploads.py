@@ -0,0 +1,272 @@
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Query
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from typing import Dict, Tuple
+from models.conversation import FileAttachment
+from models.upload import UploadSession, UploadCreate, UploadStatus
+from services.storage import storage
+from utils.auth import get_current_user
+from database import db
+from bson import ObjectId
+from datetime import datetime, timedelta
+import hashlib
+import os
+import time
+import uuid
+
+router = APIRouter(prefix="/api/uploads", tags=["uploads"])
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# A chunk (or completion) holds a lease on the session so only one worker appends to the part at a time
+UPLOAD_LEASE = timedelta(seconds=int(os.getenv("UPLOAD_LEASE_SECONDS", "120")))
+# Digest states idle this long belong to abandoned uploads (or ones another worker took over)
+HASHER_IDLE_SECONDS = int(os.getenv("UPLOAD_HASHER_IDLE_SECONDS", "3600"))
+
+# Running digests for uploads in progress on this worker, as (offset covered, hasher, last used).
+# Only trusted for the exact offset they cover; otherwise rebuilt from the staged part.
+_hashers: Dict[str, Tuple[int, "hashlib._Hash", float]] = {}
+
+async def _get_owned_upload(upload_id: str, current_user: dict) -> dict:
+    """Load an upload session and verify the current user owns it"""
+    try:
+        upload = await db.upload_sessions.find_one({"_id": ObjectId(upload_id)})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid upload ID")
+    
+    if not upload or upload["userId"] != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    return upload
+
+def _evict_idle_hashers() -> None:
+    cutoff = time.monotonic() - HASHER_IDLE_SECONDS
+    for upload_id in [key for key, (_, _, used) in _hashers.items() if used < cutoff]:
+        del _hashers[upload_id]
+
+async def _hash_part(upload_id: str, offset: int):
+    """Hash the first `offset` bytes of the staged part from storage"""
+    hasher = hashlib.sha256()
+    remaining = offset
+    async for chunk in storage.read_part(upload_id):
+        hasher.update(chunk[:remaining])
+        remaining -= min(len(chunk), remaining)
+        if not remaining:
+            break
+    return hasher
+
+async def _hasher_for(upload_id: str, offset: int):
+    """Digest state covering the first `offset` bytes of the staged part"""
+    cached = _hashers.get(upload_id)
+    if cached and cached[0] == offset:
+        return cached[1]
+    # Missing, or another worker appended since: the cached state describes different bytes
+    return await _hash_part(upload_id, offset) if offset else hashlib.sha256()
+
+def _remember_hasher(upload_id: str, offset: int, hasher) -> None:
+    _evict_idle_hashers()
+    _hashers[upload_id] = (offset, hasher, time.monotonic())
+
+async def _claim(upload: dict, offset: int) -> str:
+    """Lease a pending session at `offset` across all workers, or raise 409 with the current offset"""
+    now = datetime.utcnow()
+    owner = uuid.uuid4().hex
+    result = await db.upload_sessions.update_one(
+        {
+            "_id": upload["_id"],
+            "status": UploadStatus.PENDING,
+            "offset": offset,
+            "$or": [{"leaseUntil": None}, {"leaseUntil": {"$lt": now}}]
+        },
+        {"$set": {"leaseOwner": owner, "leaseUntil": now + UPLOAD_LEASE}}
+    )
+    if result.matched_count == 0:
+        current = await db.upload_sessions.find_one({"_id": upload["_id"]}, {"offset": 1, "status": 1, "leaseUntil": 1})
+        if current and current["status"] != UploadStatus.PENDING:
+            raise HTTPException(status_code=409, detail="Upload already completed")
+        detail = "Upload is busy" if current and current["offset"] == offset else f"Upload offset is {current['offset'] if current else 0}"
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=detail,
+            headers={"Upload-Offset": str(current["offset"] if current else 0)}
+        )
+    return owner
+
+async def _renew(upload: dict, owner: str) -> None:
+    result = await db.upload_sessions.update_one(
+        {"_id": upload["_id"], "leaseOwner": owner},
+        {"$set": {"leaseUntil": datetime.utcnow() + UPLOAD_LEASE}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload lease lost; resume from GET")
+
+async def _release(upload: dict, owner: str, offset: int) -> None:
+    """Record the acknowledged offset and give up the lease"""
+    await db.upload_sessions.update_one(
+        {"_id": upload["_id"], "leaseOwner": owner},
+        {"$set": {"offset": offset, "leaseOwner": None, "leaseUntil": None, "updatedAt": datetime.utcnow()}}
+    )
+
+def _session_response(upload: dict) -> UploadSession:
+    upload["_id"] = str(upload["_id"])
+    return UploadSession(**upload)
+
+@router.post("/", response_model=UploadSession)
+async def create_upload(data: UploadCreate, current_user: dict = Depends(get_current_user)):
+    """Start a resumable upload"""
+    if data.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes"
+        )
+    
+    upload = UploadSession(
+        userId=current_user["id"],
+        filename=data.filename,
+        size=data.size,
+        type=data.type
+    )
+    upload_dict = upload.model_dump(by_alias=True, exclude={"id"})
+    result = await db.upload_sessions.insert_one(upload_dict)
+    
+    upload_dict["_id"] = str(result.inserted_id)
+    return UploadSession(**upload_dict)
+
+@router.get("/{upload_id}", response_model=UploadSession)
+async def get_upload(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Get an upload's status; `offset` is where a resumed upload should continue"""
+    upload = await _get_owned_upload(upload_id, current_user)
+    return _session_response(upload)
+
+@router.put("/{upload_id}", response_model=UploadSession)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    """Append the request body to an upload at `offset`, streaming it straight to storage"""
+    upload = await _get_owned_upload(upload_id, current_user)
+    if upload["status"] != UploadStatus.PENDING:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+    
+    owner = await _claim(upload, offset)
+    # Bytes past the acknowledged offset were left by an interrupted writer; drop them
+    if await storage.part_size(upload_id) > offset:
+        await storage.truncate_part(upload_id, offset)
+    
+    hasher = (await _hasher_for(upload_id, offset)).copy()
+    received = offset
+    renewed = time.monotonic()
+    writer = await storage.open_part(upload_id)
+    try:
+        async for chunk in request.stream():
+            if received + len(chunk) > upload["size"]:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="More data than the declared upload size"
+                )
+            await writer.write(chunk)
+            hasher.update(chunk)
+            received += len(chunk)
+            if time.monotonic() - renewed > UPLOAD_LEASE.total_seconds() / 3:
+                await _renew(upload, owner)
+                renewed = time.monotonic()
+    except ClientDisconnect:
+        # Keep what arrived; the client resumes from the offset reported by GET
+        await writer.close()
+        _remember_hasher(upload_id, received, hasher)
+        await _release(upload, owner, received)
+        raise
+    except BaseException:
+        # Roll back to the last acknowledged offset; the next claim truncates if this worker cannot
+        await writer.close()
+        await _release(upload, owner, offset)
+        raise
+    await writer.close()
+    _remember_hasher(upload_id, received, hasher)
+    await _release(upload, owner, received)
+    
+    upload["offset"] = received
+    return _session_response(upload)
+
+@router.post("/{upload_id}/complete", response_model=FileAttachment)
+async def complete_upload(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Finish an upload and return the attachment to send with a message"""
+    upload = await _get_owned_upload(upload_id, current_user)
+    
+    if upload["status"] == UploadStatus.PENDING:
+        if upload["offset"] != upload["size"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload incomplete: {upload['offset']} of {upload['size']} bytes received",
+                headers={"Upload-Offset": str(upload["offset"])}
+            )
+        owner = await _claim(upload, upload["size"])
+        try:
+            size = upload["size"]
+            if await storage.part_size(upload_id) > size:
+                await storage.truncate_part(upload_id, size)
+            
+            # The digest names the blob, so it is always computed from the bytes actually staged
+            digest = (await _hash_part(upload_id, size)).hexdigest()
+            _hashers.pop(upload_id, None)
+            
+            # Reference the blob before looking for its file, so a cascade deletion that drops the
+            # last other reference meanwhile cannot remove the file this upload then relies on
+            await db.blobs.update_one(
+                {"_id": digest},
+                {
+                    "$inc": {"refCount": 1},
+                    "$setOnInsert": {"size": size, "createdAt": datetime.utcnow()}
+                },
+                upsert=True
+            )
+            
+            # Identical content is stored once; later uploads just reference the existing blob
+            if await storage.exists(digest):
+                await storage.discard_part(upload_id)
+            else:
+                await storage.commit_part(upload_id, digest)
+            
+            await db.upload_sessions.update_one(
+                {"_id": upload["_id"]},
+                {"$set": {
+                    "status": UploadStatus.COMPLETE,
+                    "offset": size,
+                    "sha256": digest,
+                    "leaseOwner": None,
+                    "leaseUntil": None,
+                    "updatedAt": datetime.utcnow()
+                }}
+            )
+            upload["sha256"] = digest
+        except BaseException:
+            await _release(upload, owner, upload["size"])
+            raise
+    
+    return FileAttachment(
+        filename=upload["filename"],
+        url=f"/api/uploads/blobs/{upload['sha256']}",
+        size=upload["size"],
+        type=upload["type"]
+    )
+
+@router.get("/blobs/{digest}")
+async def download_blob(digest: str, current_user: dict = Depends(get_current_user)):
+    """Stream an uploaded file the current user has uploaded"""
+    upload = await db.upload_sessions.find_one(
+        {"userId": current_user["id"], "sha256": digest},
+        {"filename": 1, "type": 1, "size": 1}
+    )
+    if not upload or not await storage.exists(digest):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return StreamingResponse(
+        storage.read_blob(digest),
+        media_type=upload["type"],
+        headers={
+            "Content-Length": str(upload["size"]),
+            "Content-Disposition": 'attachment; filename="{}"'.format(upload["filename"].replace('"', ""))
+        }
+    )
@@ -6,8 +6,19 @@ import os
 import logging
 from pathlib import Path
 
+from database import ensure_indexes
+from services.activity_log import activity_writer
+from services.compaction import compaction_worker
+from services.credits import ledger, reservation_reaper
+from services.deletion import deletion_worker
+from services.pubsub import hub
+from services.revocation import revocations
+from services.rollups import rollups
+from services.stats import stats_worker
+from utils.auth import password_hasher
+
 # Import routes
-from routes import auth, projects, admin, conversations, models, mcp_tools
+from routes import auth, projects, admin, bulk, conversations, exports, models, mcp_tools, realtime, search, uploads
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -39,9 +50,14 @@ app.include_router(api_router)
 app.include_router(auth.router)
 app.include_router(projects.router)
 app.include_router(admin.router)
+app.include_router(bulk.router)
+app.include_router(exports.router)
 app.include_router(conversations.router)
 app.include_router(models.router)
 app.include_router(mcp_tools.router)
+app.include_router(realtime.router)
+app.include_router(search.router)
+app.include_router(uploads.router)
 
 # CORS middleware
 app.add_middleware(
@@ -50,6 +66,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "X-Has-More", "ETag"],
 )
 
 # Configure logging
@@ -62,9 +79,29 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Application starting up...")
+    await ensure_indexes()
+    await hub.start()
+    await ledger.start()
+    await reservation_reaper.start()
+    await activity_writer.start()
+    await rollups.start()
+    await compaction_worker.start()
+    await revocations.start()
+    await stats_worker.start()
+    await deletion_worker.start()
     logger.info("Database connected")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await hub.stop()
+    await compaction_worker.stop()
+    await revocations.stop()
+    await stats_worker.stop()
+    await deletion_worker.stop()
+    await reservation_reaper.stop()
+    await ledger.stop()
+    await activity_writer.stop()
+    await rollups.stop()
+    password_hasher.shutdown()
     client.close()
     logger.info("Application shutting down...")
\ No newline at end of file
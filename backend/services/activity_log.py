@@ -0,0 +1,38 @@
+"""
+Activity logging off the request path.
+
+Activities are queued in a capped BatchWriter and written with insert_many by
+size or time. They are an audit trail, not a source of truth, so when the
+queue is saturated new events are dropped (and counted) instead of slowing
+mutations down. Every entry is also counted into the analytics rollups
+(services/rollups.py), whether or not it is dropped. Old entries expire through the TTL index on `timestamp`
+(see ACTIVITY_RETENTION_DAYS in database.py).
+"""
+from typing import Any, Dict, Optional
+from datetime import datetime
+from models.activity import ActivityCreate
+from services.batch_writer import BatchWriter
+from services.rollups import rollups, user_plan
+import os
+
+ENQUEUE_TIMEOUT = float(os.getenv("ACTIVITY_ENQUEUE_TIMEOUT", "0.05"))
+
+activity_writer = BatchWriter(
+    "activities",
+    max_batch=int(os.getenv("ACTIVITY_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("ACTIVITY_FLUSH_SECONDS", "2")),
+    max_queue=int(os.getenv("ACTIVITY_MAX_QUEUE", "10000")),
+)
+
+
+async def log_activity(user_id: str, action: str, resource: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+    """Queue an activity entry; returns False if it was dropped"""
+    activity = ActivityCreate(userId=user_id, action=action, resource=resource, metadata=metadata or {})
+    doc = activity.model_dump()
+    doc["timestamp"] = datetime.utcnow()
+    rollups.record("activity", doc["timestamp"], {
+        "action": action,
+        "resource": resource,
+        "plan": await user_plan(user_id),
+    })
+    return await activity_writer.put(doc, timeout=ENQUEUE_TIMEOUT)
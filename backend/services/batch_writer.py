@@ -0,0 +1,182 @@
+"""
+Buffered bulk inserts for append-only collections.
+
+Documents are queued in memory and written with a single insert_many once the
+batch fills up or the flush interval elapses, taking the insert off the
+request path.
+
+Inserts are unordered, so a failed batch is resolved document by document from
+the BulkWriteError: documents that were inserted, or that hit a duplicate key
+because an earlier attempt already wrote them, are done; only the rest are
+requeued. A document that still fails after MAX_ATTEMPTS flushes is moved to
+the `dead_letters` collection (or logged, if even that write fails).
+
+Every queue is capped. When it is full, `put` waits briefly for the flusher to
+make room (backpressure) and then drops the document; `add` drops immediately.
+Writers for critical data (the credit ledger) use a much larger cap.
+"""
+from typing import Dict, List, Optional
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from database import db
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+MAX_ATTEMPTS = 5
+DEFAULT_MAX_QUEUE = 10000
+
+
+class BatchWriter:
+    """Queue documents for a collection and flush them in batches"""
+
+    def __init__(self, collection: str, max_batch: int = 100, flush_interval: float = 1.0, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.written = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self._buffer: List[dict] = []
+        self._attempts: Dict[object, int] = {}
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flusher once it has written whatever is still queued"""
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        else:
+            await self.flush()
+        if self._buffer:
+            logger.error("Shutting down with %d documents unwritten to %s", len(self._buffer), self.collection)
+
+    def _full(self) -> bool:
+        return len(self._buffer) >= self.max_queue
+
+    def add(self, doc: dict) -> bool:
+        """Queue a document; never blocks the caller. Returns False if it was dropped"""
+        if self._full():
+            self.dropped += 1
+            self._wakeup.set()
+            return False
+        # A fixed _id makes a retried insert of an already-written document a harmless duplicate
+        doc.setdefault("_id", ObjectId())
+        self._buffer.append(doc)
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    async def put(self, doc: dict, timeout: float = 0.05) -> bool:
+        """Queue a document, waiting up to `timeout` for room if the queue is full"""
+        if self._full():
+            self._drained.clear()
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.add(doc)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch]
+                del self._buffer[:self.max_batch]
+                try:
+                    await db[self.collection].insert_many(batch, ordered=False)
+                    failed = []
+                except BulkWriteError as exc:
+                    # Unordered: everything not listed in writeErrors was inserted
+                    errors = exc.details.get("writeErrors", [])
+                    failed = [(batch[e["index"]], e.get("errmsg")) for e in errors if e.get("code") != DUPLICATE_KEY]
+                    if failed:
+                        logger.warning("Failed to write %d of %d documents to %s", len(failed), len(batch), self.collection)
+                except Exception as exc:
+                    # Nothing is known about this batch; retrying is safe since every _id is fixed
+                    logger.exception("Failed to flush %d documents to %s", len(batch), self.collection)
+                    failed = [(doc, str(exc)) for doc in batch]
+
+                self._settle(batch, failed)
+                if failed:
+                    await self._retry(failed)
+                    return
+                self._drained.set()
+
+    def _settle(self, batch: List[dict], failed: List[tuple]) -> None:
+        failed_ids = {id(doc) for doc, _ in failed}
+        for doc in batch:
+            if id(doc) not in failed_ids:
+                self._attempts.pop(doc.get("_id"), None)
+        self.written += len(batch) - len(failed)
+
+    async def _retry(self, failed: List[tuple]) -> None:
+        """Requeue failed documents at the front, dead-lettering those out of attempts"""
+        retry, dead = [], []
+        for doc, error in failed:
+            attempts = self._attempts.get(doc["_id"], 0) + 1
+            if attempts >= MAX_ATTEMPTS:
+                self._attempts.pop(doc["_id"], None)
+                dead.append((doc, error))
+            else:
+                self._attempts[doc["_id"]] = attempts
+                retry.append(doc)
+
+        self._buffer[:0] = retry
+        if len(self._buffer) > self.max_queue:
+            # Past the cap, give up the newest documents rather than grow without bound
+            for doc in self._buffer[self.max_queue:]:
+                self._attempts.pop(doc.get("_id"), None)
+            self.dropped += len(self._buffer) - self.max_queue
+            logger.error("Dropped %d documents queued for %s", len(self._buffer) - self.max_queue, self.collection)
+            del self._buffer[self.max_queue:]
+
+        if dead:
+            await self._dead_letter(dead)
+
+    async def _dead_letter(self, dead: List[tuple]) -> None:
+        now = datetime.utcnow()
+        try:
+            await db.dead_letters.insert_many([
+                {"collection": self.collection, "document": doc, "error": error, "failedAt": now}
+                for doc, error in dead
+            ])
+        except Exception:
+            for doc, error in dead:
+                logger.error("Giving up on document for %s (%s): %r", self.collection, error, doc)
+        self.dead_lettered += len(dead)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._buffer),
+            "maxQueue": self.max_queue,
+            "written": self.written,
+            "dropped": self.dropped,
+            "deadLettered": self.dead_lettered,
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        # One last pass for anything queued while the previous flush was in flight
+        await self.flush()
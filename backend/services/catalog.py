@@ -0,0 +1,85 @@
+"""
+Versioned in-process cache for the AI model and MCP tool catalogs.
+
+Each catalog has a version counter in `catalog_versions` that every admin
+mutation bumps. Cached values (pre-serialized API responses, the pricing
+table) are stored with the version they were built from and reused until the
+version moves. Workers re-read the version counters at most once per poll
+interval with a single small query, so a change made on one worker reaches the
+others within that interval; the worker that made the change sees it at once.
+"""
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from datetime import datetime
+from pymongo import ReturnDocument
+from database import db
+import asyncio
+import os
+import time
+
+MODELS = "ai_models"
+MCP_TOOLS = "mcp_tools"
+
+POLL_SECONDS = float(os.getenv("CATALOG_VERSION_POLL_SECONDS", "5"))
+
+
+class CatalogCache:
+    def __init__(self, poll_interval: float = POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._versions: Dict[str, int] = {}
+        self._polled_at = 0.0
+        self._entries: Dict[Tuple[str, str], Tuple[int, Any]] = {}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.rebuilds = 0
+
+    async def _poll(self) -> None:
+        if time.monotonic() - self._polled_at < self.poll_interval:
+            return
+        async with self._lock:
+            if time.monotonic() - self._polled_at < self.poll_interval:
+                return
+            versions = {}
+            async for doc in db.catalog_versions.find({}, {"version": 1}):
+                versions[doc["_id"]] = doc["version"]
+            self._versions = versions
+            self._polled_at = time.monotonic()
+
+    async def version(self, catalog: str) -> int:
+        await self._poll()
+        return self._versions.get(catalog, 0)
+
+    async def get(self, catalog: str, key: str, build: Callable[[], Awaitable[Any]]) -> Any:
+        """Value cached under `key` for the catalog's current version, building it if stale"""
+        # Read the version before building so a concurrent bump is never masked
+        version = await self.version(catalog)
+        entry = self._entries.get((catalog, key))
+        if entry and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+
+        value = await build()
+        self._entries[(catalog, key)] = (version, value)
+        self.rebuilds += 1
+        return value
+
+    async def bump(self, catalog: str) -> int:
+        """Record a catalog change; call after every write to the catalog collection"""
+        doc = await db.catalog_versions.find_one_and_update(
+            {"_id": catalog},
+            {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._versions[catalog] = doc["version"]
+        return doc["version"]
+
+    def stats(self) -> dict:
+        return {
+            "versions": dict(self._versions),
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "rebuilds": self.rebuilds,
+        }
+
+
+catalog = CatalogCache()
@@ -0,0 +1,100 @@
+"""
+Cold-storage compaction of old conversation history.
+
+Messages older than COMPACTION_AGE_DAYS are moved, oldest first, into
+zlib-compressed BSON blocks of up to BLOCK_SIZE messages per conversation in
+`message_blocks`, and the originals are deleted. Each block's _id is derived
+from its first message, so a run interrupted between the insert and the delete
+rewrites the same block on the next pass instead of duplicating it. Pinned
+messages are never compacted. The distinct words of the block's messages are
+kept in its text-indexed `terms` field so compacted history stays searchable.
+Reads go through services/message_store.py, which rehydrates blocks transparently.
+"""
+from typing import Optional
+from datetime import datetime, timedelta
+from bson import Binary
+from database import db
+from services.message_store import block_terms, message_key, pack_block
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_AGE_DAYS = int(os.getenv("COMPACTION_AGE_DAYS", "30"))
+COMPACTION_INTERVAL_SECONDS = int(os.getenv("COMPACTION_INTERVAL_SECONDS", str(6 * 60 * 60)))
+BLOCK_SIZE = 256
+
+
+async def compact_conversation(conversation_id: str, user_id: str, cutoff: datetime) -> int:
+    """Pack a conversation's messages older than `cutoff` into blocks; returns messages compacted"""
+    compacted = 0
+    while True:
+        messages = await db.messages.find({
+            "conversationId": conversation_id,
+            "timestamp": {"$lt": cutoff},
+            "metadata.pinned": {"$ne": True}
+        }).sort([("timestamp", 1), ("_id", 1)]).limit(BLOCK_SIZE).to_list(BLOCK_SIZE)
+        if not messages:
+            return compacted
+
+        start_ts, start_id = message_key(messages[0])
+        end_ts, end_id = message_key(messages[-1])
+        block = {
+            "conversationId": conversation_id,
+            "userId": user_id,
+            "startTimestamp": start_ts,
+            "startId": start_id,
+            "endTimestamp": end_ts,
+            "endId": end_id,
+            "count": len(messages),
+            "data": Binary(pack_block(messages)),
+            "terms": block_terms(messages),
+            "createdAt": datetime.utcnow()
+        }
+        await db.message_blocks.replace_one({"_id": f"{conversation_id}:{start_id}"}, block, upsert=True)
+        await db.messages.delete_many({"_id": {"$in": [msg["_id"] for msg in messages]}})
+        compacted += len(messages)
+
+        if len(messages) < BLOCK_SIZE:
+            return compacted
+
+
+async def run_compaction(age_days: int = COMPACTION_AGE_DAYS) -> int:
+    """Compact every conversation that can hold messages older than `age_days`"""
+    cutoff = datetime.utcnow() - timedelta(days=age_days)
+    total = 0
+    # Blocks take their owner from the conversation; messages written before search lack userId
+    async for conversation in db.conversations.find({"createdAt": {"$lt": cutoff}}, {"userId": 1}):
+        total += await compact_conversation(str(conversation["_id"]), conversation["userId"], cutoff)
+    if total:
+        logger.info("Compacted %d messages older than %d days", total, age_days)
+    return total
+
+
+class CompactionWorker:
+    """Runs compaction periodically in the background"""
+
+    def __init__(self, interval: int = COMPACTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_compaction()
+            except Exception:
+                logger.exception("Message compaction failed")
+
+
+compaction_worker = CompactionWorker()
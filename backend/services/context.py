@@ -0,0 +1,71 @@
+"""
+Prompt assembly under a token budget.
+
+The assembler walks a conversation newest-first and stops as soon as the budget
+is spent, using the token count stored on each message when it was written, so
+the cost of a turn is proportional to the messages selected rather than to the
+length of the history. Messages pinned through the conversations API
+(metadata.pinned) are always included first; compaction leaves them in the live
+collection.
+"""
+from typing import List, Tuple
+from database import db
+from services.message_store import iter_compacted_newest_first
+from services.metering import message_tokens
+
+CONTEXT_PROJECTION = {"role": 1, "content": 1, "timestamp": 1, "metadata.tokens": 1, "metadata.pinned": 1}
+CURSOR_BATCH_SIZE = 64
+
+
+def context_budget(max_completion_tokens: int, pricing: dict) -> int:
+    """Tokens available for the prompt: the model's window minus the completion allowance"""
+    window = pricing["maxTokens"]
+    return max(window - min(max_completion_tokens, window // 2), 0)
+
+
+async def assemble_context(conversation_id: str, budget: int) -> Tuple[List[dict], int]:
+    """Select pinned and most recent messages that fit in `budget` tokens.
+
+    Returns the prompt messages in chronological order and their total token count.
+    """
+    used = 0
+
+    pinned = []
+    cursor = db.messages.find(
+        {"conversationId": conversation_id, "metadata.pinned": True},
+        CONTEXT_PROJECTION
+    ).sort([("timestamp", 1), ("_id", 1)])
+    async for doc in cursor:
+        tokens = message_tokens(doc)
+        if used + tokens > budget:
+            break
+        used += tokens
+        pinned.append(doc)
+
+    recent = []
+    full = False
+    cursor = db.messages.find({"conversationId": conversation_id}, CONTEXT_PROJECTION) \
+        .sort([("timestamp", -1), ("_id", -1)]) \
+        .batch_size(CURSOR_BATCH_SIZE)
+    async for doc in cursor:
+        if (doc.get("metadata") or {}).get("pinned"):
+            continue
+        tokens = message_tokens(doc)
+        if used + tokens > budget:
+            full = True
+            break
+        used += tokens
+        recent.append(doc)
+    await cursor.close()
+
+    # Budget left over after the live history: continue into compacted blocks
+    if not full:
+        async for doc in iter_compacted_newest_first(conversation_id):
+            tokens = message_tokens(doc)
+            if used + tokens > budget:
+                break
+            used += tokens
+            recent.append(doc)
+    recent.reverse()
+
+    return [{"role": doc["role"], "content": doc["content"]} for doc in pinned + recent], used
@@ -0,0 +1,159 @@
+"""
+Credit reservation and settlement.
+
+A turn reserves its estimated cost with one conditional find_one_and_update, so
+concurrent sends can never overdraw a balance. Once the real cost is known the
+reservation is settled (or released if the turn failed), and the ledger entry
+is queued for a batched insert into credit_transactions.
+
+Each reservation is also pushed onto the user's `reservations` array, with its
+timestamp, in the same update. Settling or releasing pulls it off again, so a
+reservation still there after RESERVATION_TIMEOUT_SECONDS belongs to a turn
+that died (a crashed worker, a lost task) and is released by the reaper.
+"""
+from typing import Optional
+from fastapi import HTTPException, status
+from bson import ObjectId
+from datetime import datetime, timedelta
+from models.credits import CreditTransaction
+from database import db
+from services.batch_writer import BatchWriter
+from services.user_cache import user_profiles
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TIMEOUT_SECONDS = int(os.getenv("RESERVATION_TIMEOUT_SECONDS", "900"))
+REAPER_INTERVAL_SECONDS = int(os.getenv("RESERVATION_REAPER_INTERVAL_SECONDS", "60"))
+
+ledger = BatchWriter(
+    "credit_transactions",
+    max_batch=200,
+    flush_interval=1.0,
+    max_queue=int(os.getenv("CREDIT_LEDGER_MAX_QUEUE", "100000")),
+)
+
+
+async def reserve(user_id: str, amount: float) -> dict:
+    """Hold `amount` credits for a pending operation, or raise 402 if the balance is short"""
+    reservation = {"id": str(ObjectId()), "amount": amount, "at": datetime.utcnow()}
+    user = await db.users.find_one_and_update(
+        {"_id": ObjectId(user_id), "credits": {"$gte": amount}},
+        {
+            "$inc": {"credits": -amount, "reservedCredits": amount},
+            "$push": {"reservations": reservation}
+        },
+        projection={"_id": 1}
+    )
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Insufficient credits"
+        )
+    return reservation
+
+
+async def _return_reservation(user_id: str, reservation: dict, charge: float = 0.0) -> bool:
+    """Give back a held reservation, charging `charge` in the same update; False if it was already reaped"""
+    result = await db.users.update_one(
+        {"_id": ObjectId(user_id), "reservations.id": reservation["id"]},
+        {
+            "$inc": {
+                "credits": reservation["amount"] - charge,
+                "reservedCredits": -reservation["amount"],
+                "totalCreditsUsed": charge
+            },
+            "$pull": {"reservations": {"id": reservation["id"]}},
+            "$set": {"updatedAt": datetime.utcnow()}
+        }
+    )
+    return result.modified_count > 0
+
+
+async def settle(
+    user_id: str,
+    reservation: Optional[dict],
+    actual: float,
+    conversation_id: Optional[str] = None,
+    description: str = "Message sent",
+    metadata: Optional[dict] = None
+) -> None:
+    """Convert a reservation into the actual charge and record it in the ledger"""
+    if not reservation and not actual:
+        return
+
+    if not reservation or not await _return_reservation(user_id, reservation, actual):
+        # Nothing held (or the reaper already gave it back): charge the balance directly
+        await db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {
+                "$inc": {"credits": -actual, "totalCreditsUsed": actual},
+                "$set": {"updatedAt": datetime.utcnow()}
+            }
+        )
+    user_profiles.invalidate(user_id)
+
+    transaction = CreditTransaction(
+        userId=user_id,
+        amount=-actual,
+        type="debit",
+        description=description,
+        conversationId=conversation_id,
+        metadata=metadata or {}
+    )
+    ledger.add(transaction.model_dump(by_alias=True, exclude={"id"}))
+
+
+async def release(user_id: str, reservation: Optional[dict]) -> None:
+    """Return a reservation to the balance without charging anything"""
+    if not reservation:
+        return
+
+    await _return_reservation(user_id, reservation)
+    user_profiles.invalidate(user_id)
+
+
+async def reap_reservations(timeout_seconds: int = RESERVATION_TIMEOUT_SECONDS) -> int:
+    """Release reservations held longer than `timeout_seconds`; returns how many were released"""
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    released = 0
+    async for user in db.users.find({"reservations.at": {"$lt": cutoff}}, {"reservations": 1}):
+        user_id = str(user["_id"])
+        for reservation in user.get("reservations", []):
+            if reservation["at"] < cutoff and await _return_reservation(user_id, reservation):
+                released += 1
+        user_profiles.invalidate(user_id)
+    if released:
+        logger.warning("Released %d stale credit reservations", released)
+    return released
+
+
+class ReservationReaper:
+    """Releases stale credit reservations periodically in the background"""
+
+    def __init__(self, interval: int = REAPER_INTERVAL_SECONDS):
+        self.interval = interval
+        self.released = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.released += await reap_reservations()
+            except Exception:
+                logger.exception("Reservation reaper failed")
+
+
+reservation_reaper = ReservationReaper()
@@ -0,0 +1,273 @@
+"""
+Background cascade deletion.
+
+Deleting a user or conversation only marks it `deleting` and queues a job in
+`deletion_jobs`; the request returns straight away. Workers claim jobs under a
+lease and delete dependents step by step in bounded batches, pausing between
+batches to keep write load flat. Progress (current step, documents deleted per
+collection) is saved after every batch, and a job whose worker died is picked
+up again once its lease expires. Every step re-queries what is left, so
+repeating a batch after a crash is harmless. A job that keeps failing is retried
+up to MAX_ATTEMPTS times and then parked as `failed` for an operator to look at.
+
+A user's conversations are not deleted by the user job itself: it marks them
+and queues one conversation job each.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from database import db
+from services import refresh_tokens, stats
+from services.storage import storage
+from services.user_cache import user_profiles
+from utils.auth import revoke_users_tokens
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("DELETION_BATCH_SIZE", "500"))
+BATCH_PAUSE_SECONDS = float(os.getenv("DELETION_BATCH_PAUSE", "0.1"))
+POLL_SECONDS = float(os.getenv("DELETION_POLL_SECONDS", "5"))
+LEASE = timedelta(seconds=int(os.getenv("DELETION_LEASE_SECONDS", "60")))
+MAX_ATTEMPTS = int(os.getenv("DELETION_MAX_ATTEMPTS", "5"))
+# Finished jobs stay visible for a while, then expire through a TTL index
+JOB_RETENTION = timedelta(days=7)
+
+
+async def _queue_conversations(conversations: List[dict]) -> None:
+    ids = [conv["_id"] for conv in conversations]
+    await db.conversations.update_many({"_id": {"$in": ids}}, {"$set": {"deleting": True}})
+    await enqueue_many("conversation", [(str(conv["_id"]), conv["userId"]) for conv in conversations])
+
+
+async def _release_uploads(sessions: List[dict]) -> None:
+    for session in sessions:
+        if not session.get("sha256"):
+            await storage.discard_part(str(session["_id"]))
+            continue
+        blob = await db.blobs.find_one_and_update(
+            {"_id": session["sha256"]},
+            {"$inc": {"refCount": -1}},
+            projection={"refCount": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob and blob["refCount"] <= 0:
+            # Conditional, so a blob re-referenced by an upload completing meanwhile is kept
+            result = await db.blobs.delete_one({"_id": session["sha256"], "refCount": {"$lte": 0}})
+            if result.deleted_count:
+                await storage.delete_blob(session["sha256"])
+
+
+# A step is (collection, filter builder, projection, hook run on each batch before it is deleted).
+# The hook may delete or otherwise consume the batch itself (delete=False).
+Step = Tuple[str, Callable[[str], dict], Optional[dict], Optional[Callable], bool]
+
+STEPS: Dict[str, List[Step]] = {
+    "conversation": [
+        ("messages", lambda cid: {"conversationId": cid}, None, None, True),
+        ("message_blocks", lambda cid: {"conversationId": cid}, None, None, True),
+        ("conversations", lambda cid: {"_id": ObjectId(cid)}, None, None, True),
+    ],
+    "user": [
+        ("conversations", lambda uid: {"userId": uid, "deleting": {"$ne": True}}, {"userId": 1}, _queue_conversations, False),
+        ("projects", lambda uid: {"userId": uid}, {"status": 1}, stats.projects_removed, True),
+        ("upload_sessions", lambda uid: {"userId": uid}, {"sha256": 1}, _release_uploads, True),
+        ("user_mcp_configs", lambda uid: {"userId": uid}, None, None, True),
+        ("credit_transactions", lambda uid: {"userId": uid}, None, None, True),
+        ("activities", lambda uid: {"userId": uid}, None, None, True),
+        ("refresh_tokens", lambda uid: {"userId": uid}, None, None, True),
+        ("users", lambda uid: {"_id": ObjectId(uid)}, None, None, True),
+    ],
+}
+
+
+async def enqueue(kind: str, target_id: str, user_id: str) -> str:
+    """Queue a deletion job; queuing the same target twice returns the existing job"""
+    return (await enqueue_many(kind, [(target_id, user_id)]))[0]
+
+
+async def enqueue_many(kind: str, targets: List[Tuple[str, str]]) -> List[str]:
+    """Queue jobs for (target id, user id) pairs in one insert; returns their job ids"""
+    if not targets:
+        return []
+    now = datetime.utcnow()
+    jobs = [{
+        "_id": f"{kind}:{target_id}",
+        "kind": kind,
+        "targetId": target_id,
+        "userId": user_id,
+        "status": "pending",
+        "step": 0,
+        "deleted": {},
+        "queued": {},
+        "createdAt": now,
+        "updatedAt": now,
+    } for target_id, user_id in targets]
+    try:
+        await db.deletion_jobs.insert_many(jobs, ordered=False)
+    except BulkWriteError as e:
+        # Targets already queued keep their existing job; anything else is a real failure
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+    deletion_worker.wake()
+    return [job["_id"] for job in jobs]
+
+
+async def start_user_deletion(user_id: str) -> Optional[str]:
+    """Mark a user deleting, lock them out and queue the cascade; None if no such (live) user"""
+    return (await start_user_deletions([user_id])).get(user_id)
+
+
+async def start_user_deletions(user_ids: List[str]) -> Dict[str, str]:
+    """Start deleting several users with a fixed number of writes; maps each live user's id to its job"""
+    # Tag this call's marks so exactly the users it claimed (not ones already deleting) are counted
+    marker = uuid.uuid4().hex
+    ids = [ObjectId(user_id) for user_id in user_ids]
+    await db.users.update_many(
+        {"_id": {"$in": ids}, "deleting": {"$ne": True}},
+        {"$set": {"deleting": True, "deletionMarker": marker, "updatedAt": datetime.utcnow()}}
+    )
+    users = await db.users.find(
+        {"_id": {"$in": ids}, "deletionMarker": marker},
+        {"subscription.plan": 1, "lastLogin": 1}
+    ).to_list(None)
+    if not users:
+        return {}
+
+    claimed = [str(user["_id"]) for user in users]
+    for user_id in claimed:
+        user_profiles.invalidate(user_id)
+    await revoke_users_tokens(claimed)
+    await refresh_tokens.revoke_users(claimed)
+    await stats.users_removed(users)
+    job_ids = await enqueue_many("user", [(user_id, user_id) for user_id in claimed])
+    return dict(zip(claimed, job_ids))
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    return await db.deletion_jobs.find_one({"_id": job_id}, {"leaseOwner": 0})
+
+
+class DeletionWorker:
+    """Claims deletion jobs and runs them batch by batch"""
+
+    def __init__(self, poll_interval: float = POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex
+        self.completed = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Unfinished jobs keep their progress and are resumed when the lease runs out
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await db.deletion_jobs.find_one_and_update(
+            {
+                "status": {"$in": ["pending", "running"]},
+                "$or": [{"leaseExpiresAt": {"$exists": False}}, {"leaseExpiresAt": {"$lt": now}}]
+            },
+            {"$set": {"status": "running", "leaseOwner": self.owner, "leaseExpiresAt": now + LEASE}},
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _save(self, job: dict, update: dict) -> bool:
+        """Persist progress and renew the lease; False if another worker took the job over"""
+        now = datetime.utcnow()
+        update.setdefault("$set", {}).update(leaseExpiresAt=now + LEASE, updatedAt=now)
+        result = await db.deletion_jobs.update_one({"_id": job["_id"], "leaseOwner": self.owner}, update)
+        return result.matched_count == 1
+
+    async def run_job(self, job: dict) -> None:
+        steps = STEPS[job["kind"]]
+        step = job["step"]
+        while step < len(steps):
+            collection, build_filter, projection, on_batch, delete = steps[step]
+            batch = await db[collection].find(build_filter(job["targetId"]), projection or {"_id": 1}) \
+                .limit(BATCH_SIZE).to_list(BATCH_SIZE)
+            if not batch:
+                step += 1
+                if not await self._save(job, {"$set": {"step": step}}):
+                    return
+                continue
+            
+            if on_batch:
+                await on_batch(batch)
+            if delete:
+                result = await db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+                progress = {f"deleted.{collection}": result.deleted_count}
+            else:
+                progress = {f"queued.{collection}": len(batch)}
+            if not await self._save(job, {"$inc": progress}):
+                return
+            await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+        now = datetime.utcnow()
+        await self._save(job, {
+            "$set": {"status": "done", "completedAt": now, "expiresAt": now + JOB_RETENTION},
+            "$unset": {"leaseOwner": ""}
+        })
+        self.completed += 1
+
+    async def _record_failure(self, job: dict, error: Exception) -> None:
+        """Count a failed attempt; the lease is left to expire so the job is retried later"""
+        now = datetime.utcnow()
+        job = await db.deletion_jobs.find_one_and_update(
+            {"_id": job["_id"], "leaseOwner": self.owner},
+            {"$set": {"error": str(error), "updatedAt": now}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job and job["attempts"] >= MAX_ATTEMPTS:
+            await db.deletion_jobs.update_one(
+                {"_id": job["_id"], "leaseOwner": self.owner},
+                {"$set": {"status": "failed", "failedAt": now}, "$unset": {"leaseOwner": "", "leaseExpiresAt": ""}}
+            )
+            self.failed += 1
+            logger.error(
+                "Deletion job %s (%s %s) failed %d times, giving up: %s",
+                job["_id"], job["kind"], job["targetId"], job["attempts"], error
+            )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+                while job:
+                    try:
+                        await self.run_job(job)
+                    except Exception as e:
+                        logger.exception("Deletion job %s failed", job["_id"])
+                        await self._record_failure(job, e)
+                    job = await self._claim()
+            except Exception:
+                logger.exception("Deletion worker poll failed")
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def stats(self) -> dict:
+        return {"completed": self.completed, "failed": self.failed}
+
+
+deletion_worker = DeletionWorker()
@@ -0,0 +1,177 @@
+"""
+Read access to conversation messages.
+
+Messages are paged by the (timestamp, _id) key so every read is an index range
+scan of at most `limit + 1` documents, however long the conversation is.
+
+Old history may have been compacted into compressed blocks in
+`message_blocks` (see services/compaction.py). Pages are merged from the live
+collection and from the blocks whose key range overlaps the page, so callers
+never see the difference. Recently decompressed blocks are kept in a small LRU.
+
+Each block also carries the distinct words of its messages in `terms`, under a
+text index, so search (routes/search.py) can find candidate blocks without an
+uncompressed copy of the content; matches are confirmed on the decompressed messages.
+"""
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from database import db
+from utils.pagination import decode_cursor, keyset_filter
+import bson
+import re
+import zlib
+
+MESSAGE_SORT = [("timestamp", 1), ("_id", 1)]
+BLOCK_CACHE_SIZE = 32
+MAX_TERM_LENGTH = 64
+
+_block_cache: "OrderedDict[str, List[dict]]" = OrderedDict()
+
+
+def message_key(doc: dict) -> tuple:
+    return doc["timestamp"], doc["_id"]
+
+
+def pack_block(messages: List[dict]) -> bytes:
+    """Compress a run of message documents into a block payload"""
+    return zlib.compress(bson.encode({"messages": messages}), 6)
+
+
+def unpack_block(data: bytes) -> List[dict]:
+    return bson.decode(zlib.decompress(data))["messages"]
+
+
+def block_terms(messages: List[dict]) -> List[str]:
+    """Distinct lowercase words of the messages' content, for the block's text index"""
+    terms = set()
+    for msg in messages:
+        terms.update(re.findall(r"\w+", msg.get("content", "").lower()))
+    return sorted(term for term in terms if 1 < len(term) <= MAX_TERM_LENGTH)
+
+
+async def block_messages(block: dict) -> List[dict]:
+    """Messages in a block, decompressing (and caching) on first use"""
+    block_id = block["_id"]
+    messages = _block_cache.get(block_id)
+    if messages is not None:
+        _block_cache.move_to_end(block_id)
+        return messages
+
+    doc = await db.message_blocks.find_one({"_id": block_id}, {"data": 1})
+    messages = unpack_block(doc["data"]) if doc else []
+    _block_cache[block_id] = messages
+    if len(_block_cache) > BLOCK_CACHE_SIZE:
+        _block_cache.popitem(last=False)
+    return messages
+
+
+def _block_bound(prefix: str, key: tuple, op: str) -> dict:
+    """Filter blocks whose start/end key is strictly beyond `key`"""
+    value, doc_id = key
+    return {"$or": [
+        {f"{prefix}Timestamp": {op: value}},
+        {f"{prefix}Timestamp": value, f"{prefix}Id": {op: doc_id}}
+    ]}
+
+
+async def _blocks_in_range(
+    conversation_id: str,
+    direction: int,
+    lower: Optional[tuple] = None,
+    upper: Optional[tuple] = None
+) -> AsyncIterator[dict]:
+    """Yield block headers overlapping (lower, upper) in paging order"""
+    query = {"conversationId": conversation_id}
+    bounds = []
+    if lower:
+        bounds.append(_block_bound("end", lower, "$gt"))
+    if upper:
+        bounds.append(_block_bound("start", upper, "$lt"))
+    if bounds:
+        query["$and"] = bounds
+
+    cursor = db.message_blocks.find(query, {"data": 0, "terms": 0}).sort(
+        [("startTimestamp", direction), ("startId", direction)]
+    )
+    async for block in cursor:
+        yield block
+
+
+async def fetch_page(
+    conversation_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50
+) -> Tuple[List[dict], bool]:
+    """Return up to `limit` messages in chronological order and whether more exist in the paging direction.
+
+    With `after` the page walks forward from that cursor; otherwise it walks backward
+    from `before`, or from the newest message when no cursor is given ("latest N").
+    """
+    query = {"conversationId": conversation_id}
+    bounds = []
+    if after:
+        bounds.append(keyset_filter("timestamp", after, 1))
+    if before:
+        bounds.append(keyset_filter("timestamp", before, -1))
+    if bounds:
+        query["$and"] = bounds
+
+    direction = 1 if after else -1
+    sort = [(field, direction) for field, _ in MESSAGE_SORT]
+    docs = await db.messages.find(query).sort(sort).limit(limit + 1).to_list(limit + 1)
+
+    # Blocks only matter if they can hold keys that would land inside this page
+    lower = decode_cursor(after) if after else None
+    upper = decode_cursor(before) if before else None
+    if len(docs) > limit:
+        edge = message_key(docs[-1])
+        if direction > 0:
+            upper = edge
+        else:
+            lower = edge
+
+    compacted = []
+    async for block in _blocks_in_range(conversation_id, direction, lower, upper):
+        for msg in await block_messages(block):
+            key = message_key(msg)
+            if (lower is None or key > lower) and (upper is None or key < upper):
+                # Copy so callers can mutate results without touching the cache
+                compacted.append(dict(msg))
+        # Blocks are disjoint, so once a page's worth is collected the rest lie beyond it
+        if len(compacted) > limit:
+            break
+
+    if compacted:
+        merged: Dict = {doc["_id"]: doc for doc in compacted}
+        merged.update((doc["_id"], doc) for doc in docs)
+        docs = sorted(merged.values(), key=message_key, reverse=direction < 0)[:limit + 1]
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if direction < 0:
+        docs.reverse()
+    return docs, has_more
+
+
+async def iter_compacted_newest_first(conversation_id: str) -> AsyncIterator[dict]:
+    """Yield compacted messages from newest to oldest"""
+    async for block in _blocks_in_range(conversation_id, -1):
+        for msg in reversed(await block_messages(block)):
+            yield dict(msg)
+
+
+async def summarize(conversation_id: str, preview_length: int) -> dict:
+    """Message count and latest preview computed from history, live and compacted"""
+    count = await db.messages.count_documents({"conversationId": conversation_id})
+    async for block in db.message_blocks.find({"conversationId": conversation_id}, {"count": 1}):
+        count += block.get("count", 0)
+
+    latest = await db.messages.find({"conversationId": conversation_id}, {"content": 1}) \
+        .sort([(field, -1) for field, _ in MESSAGE_SORT]).limit(1).to_list(1)
+    if not latest:
+        async for msg in iter_compacted_newest_first(conversation_id):
+            latest = [msg]
+            break
+    preview = latest[0].get("content", "")[:preview_length] if latest else None
+    return {"messageCount": count, "lastMessagePreview": preview}
@@ -0,0 +1,107 @@
+"""
+Token counting and turn pricing.
+
+Token counts come from tiktoken when it is installed and from a single-pass
+regex estimator otherwise. Counts are computed once per message (stored in the
+message's metadata and memoized in process), and turns are priced from the
+model catalog entry for the conversation's model.
+"""
+from typing import Dict
+from collections import OrderedDict
+from database import db
+from services.catalog import MODELS, catalog
+import hashlib
+import os
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional
+    _encoding = None
+
+# Words are split into chunks of up to four characters, roughly how BPE vocabularies segment text
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+CREDITS_PER_DOLLAR = float(os.getenv("CREDITS_PER_DOLLAR", "100"))
+MIN_TURN_COST = float(os.getenv("MIN_TURN_COST", "0.01"))
+DEFAULT_PRICE_PER_THOUSAND = float(os.getenv("DEFAULT_PRICE_PER_THOUSAND", "0.003"))
+DEFAULT_MAX_TOKENS = 200000
+
+TOKEN_CACHE_SIZE = 10000
+
+_token_cache: "OrderedDict[bytes, int]" = OrderedDict()
+
+
+def count_tokens(text: str) -> int:
+    """Count (or estimate) the tokens in a piece of text"""
+    if not text:
+        return 0
+
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        _token_cache.move_to_end(key)
+        return cached
+
+    if _encoding is not None:
+        tokens = len(_encoding.encode(text, disallowed_special=()))
+    else:
+        tokens = len(_TOKEN_RE.findall(text))
+
+    _token_cache[key] = tokens
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return tokens
+
+
+def message_tokens(message: dict) -> int:
+    """Token count for a stored message, using the count recorded at write time when present"""
+    tokens = (message.get("metadata") or {}).get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message.get("content", ""))
+    return tokens
+
+
+async def _load_pricing_table() -> Dict[str, dict]:
+    table = {}
+    async for model in db.ai_models.find(
+        {},
+        {"_id": 0, "name": 1, "provider": 1, "maxTokens": 1, "pricePerThousandTokens": 1}
+    ):
+        table[model["name"]] = model
+    return table
+
+
+async def get_model_pricing(model_name: str) -> dict:
+    """Pricing fields of a catalog model, from the versioned catalog cache"""
+    model = (await catalog.get(MODELS, "pricing", _load_pricing_table)).get(model_name) or {}
+    return {
+        "name": model_name,
+        "provider": model.get("provider"),
+        "maxTokens": model.get("maxTokens", DEFAULT_MAX_TOKENS),
+        "pricePerThousandTokens": model.get("pricePerThousandTokens", DEFAULT_PRICE_PER_THOUSAND),
+    }
+
+
+def price_tokens(tokens: int, pricing: dict) -> float:
+    """Credits charged for a number of tokens at a model's price"""
+    return tokens / 1000 * pricing["pricePerThousandTokens"] * CREDITS_PER_DOLLAR
+
+
+def estimate_turn_cost(prompt_tokens: int, max_completion_tokens: int, pricing: dict) -> float:
+    """Upper-bound cost of a turn, used as the credit reservation"""
+    completion = min(max_completion_tokens, pricing["maxTokens"])
+    return round(max(price_tokens(prompt_tokens + completion, pricing), MIN_TURN_COST), 6)
+
+
+def meter_turn(prompt_tokens: int, completion_tokens: int, pricing: dict) -> Dict:
+    """Usage record for a completed turn"""
+    total = prompt_tokens + completion_tokens
+    return {
+        "model": pricing["name"],
+        "promptTokens": prompt_tokens,
+        "completionTokens": completion_tokens,
+        "totalTokens": total,
+        "credits": round(max(price_tokens(total, pricing), MIN_TURN_COST), 6),
+    }
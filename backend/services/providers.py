@@ -0,0 +1,69 @@
+"""
+Chat completion providers.
+
+A provider turns a list of prompt messages into a stream of text deltas.
+Routes only talk to the ChatProvider interface, so a real model backend can be
+registered without touching the conversation endpoints.
+"""
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+from models.conversation import ConversationSettings
+import asyncio
+import os
+
+DEFAULT_PROVIDER = os.getenv("CHAT_PROVIDER", "fake")
+
+
+class ChatProvider(ABC):
+    """Base class for chat completion backends"""
+
+    name: str = "base"
+
+    @abstractmethod
+    def stream(self, messages: List[Dict[str, str]], settings: ConversationSettings) -> AsyncIterator[str]:
+        """Yield response text deltas for the given prompt messages"""
+
+    async def complete(self, messages: List[Dict[str, str]], settings: ConversationSettings) -> str:
+        """Collect the full response text"""
+        parts = []
+        async for delta in self.stream(messages, settings):
+            parts.append(delta)
+        return "".join(parts)
+
+
+class FakeProvider(ChatProvider):
+    """Local provider that answers with a canned response, one word at a time"""
+
+    name = "fake"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def stream(self, messages: List[Dict[str, str]], settings: ConversationSettings) -> AsyncIterator[str]:
+        prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        text = (
+            f"I understand you want to build: {prompt[:100]}... "
+            "I'm processing your request with the selected model and settings."
+        )
+        for index, word in enumerate(text.split(" ")):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield word if index == 0 else " " + word
+
+
+_providers: Dict[str, ChatProvider] = {
+    FakeProvider.name: FakeProvider(delay=float(os.getenv("FAKE_PROVIDER_DELAY", "0")))
+}
+
+
+def register_provider(provider: ChatProvider) -> None:
+    """Register (or replace) a provider under its name"""
+    _providers[provider.name] = provider
+
+
+def get_provider(name: Optional[str] = None) -> ChatProvider:
+    """Return the named provider, falling back to the configured default"""
+    provider = _providers.get(name or DEFAULT_PROVIDER) or _providers.get(DEFAULT_PROVIDER)
+    if provider is None:
+        raise RuntimeError(f"Chat provider '{name or DEFAULT_PROVIDER}' is not registered")
+    return provider
@@ -0,0 +1,181 @@
+"""
+In-process pub/sub hub for pushing updates to connected clients.
+
+Local subscribers (WebSocket connections) register on the hub by channel. Where
+published events travel is decided by the backend: the in-memory backend hands
+them straight back to this process, while the Mongo backend writes them to a
+capped collection that every worker tails, so all workers see every event.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+from fastapi.encoders import jsonable_encoder
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from database import db
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, dict], Awaitable[None]]
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class PubSubBackend(ABC):
+    """Transport that carries published events to every worker's hub"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    def attach(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, event: dict) -> None:
+        """Send an event to all hubs subscribed through this backend"""
+
+
+class InMemoryBackend(PubSubBackend):
+    """Single-worker backend: events never leave the process"""
+
+    async def publish(self, channel: str, event: dict) -> None:
+        await self._deliver(channel, event)
+
+
+class MongoBackend(PubSubBackend):
+    """Multi-worker backend built on a tailable cursor over a capped collection"""
+
+    def __init__(self, collection: str = "pubsub_events", size_bytes: int = 16 * 1024 * 1024):
+        super().__init__()
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def publish(self, channel: str, event: dict) -> None:
+        await db[self.collection_name].insert_one({"channel": channel, "event": event})
+
+    async def _tail(self) -> None:
+        collection = db[self.collection_name]
+        # Only deliver events published after this worker started
+        last = await collection.find_one(sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            # ObjectIds from different workers are not ordered, but natural order is insertion
+            # order: reopen the tail from the start and skip past the last event delivered
+            if last_id and not await collection.count_documents({"_id": last_id}, limit=1):
+                # Rolled out of the capped collection: skip ahead rather than replay old events
+                logger.warning("Pub/sub tail fell behind the capped collection; events were lost")
+                last = await collection.find_one(sort=[("$natural", -1)])
+                last_id = last["_id"] if last else None
+            skipping = last_id is not None
+            cursor = collection.find(cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        if skipping:
+                            skipping = doc["_id"] != last_id
+                            continue
+                        last_id = doc["_id"]
+                        await self._deliver(doc["channel"], doc["event"])
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Pub/sub tail failed, retrying")
+            await asyncio.sleep(1)
+
+
+class Subscription:
+    """A local subscriber's bounded event queue"""
+
+    def __init__(self, hub: "PubSubHub", channels: Set[str]):
+        self.hub = hub
+        self.channels = channels
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event: dict) -> None:
+        # A slow consumer loses its oldest events instead of stalling the hub
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class PubSubHub:
+    """Fans published events out to local subscribers by channel"""
+
+    def __init__(self, backend: PubSubBackend):
+        self.backend = backend
+        self.backend.attach(self._deliver)
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    async def publish(self, channel: str, event_type: str, data: Any = None, **fields) -> None:
+        """Publish an event; failures are logged rather than failing the caller's request"""
+        event = jsonable_encoder({"type": event_type, **fields, "data": data})
+        try:
+            await self.backend.publish(channel, event)
+        except Exception:
+            logger.exception("Failed to publish %s on %s", event_type, channel)
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        subscription = Subscription(self, set(channels))
+        for channel in subscription.channels:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for channel in subscription.channels:
+            subscribers = self._subscribers.get(channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    async def _deliver(self, channel: str, event: dict) -> None:
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription.put(event)
+
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def _create_backend() -> PubSubBackend:
+    backend = os.getenv("PUBSUB_BACKEND", "memory")
+    if backend == "mongo":
+        return MongoBackend()
+    return InMemoryBackend()
+
+
+hub = PubSubHub(_create_backend())
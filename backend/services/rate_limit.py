@@ -0,0 +1,190 @@
+"""
+Login throttling.
+
+Failed logins are counted per client IP and per email over a sliding window.
+Once a key reaches its limit it is blocked, and each repeat block doubles in
+length. Requests are checked before any user lookup or bcrypt work, so a login
+flood is turned away for the cost of a store read.
+
+Where the counters live is decided by the store: in-memory for a single
+worker, or the `login_attempts` collection (expired by a TTL index) when
+several workers must share them.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+from datetime import datetime
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+from database import db
+import math
+import os
+import time
+
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+
+class ThrottleStore(ABC):
+    """Holds per-key failure timestamps, block deadline and strike count"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def add_failure(self, key: str, at: float, keep: int, expires_at: float) -> dict:
+        """Atomically record a failure, keeping the newest `keep`, and return the state"""
+
+    @abstractmethod
+    async def block(self, key: str, until: float, expires_at: float) -> None:
+        """Block a key until `until`, add a strike and start a fresh window"""
+
+    @abstractmethod
+    async def clear(self, key: str) -> None:
+        ...
+
+
+class InMemoryStore(ThrottleStore):
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, dict]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        state = self._states.get(key)
+        if state and state["expiresAt"] <= time.time():
+            del self._states[key]
+            return None
+        return state
+
+    async def add_failure(self, key: str, at: float, keep: int, expires_at: float) -> dict:
+        state = await self.get(key) or {"failures": [], "strikes": 0, "blockedUntil": 0.0}
+        state["failures"] = (state["failures"] + [at])[-keep:]
+        state["expiresAt"] = expires_at
+        self._states[key] = state
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_keys:
+            self._states.popitem(last=False)
+        return state
+
+    async def block(self, key: str, until: float, expires_at: float) -> None:
+        state = self._states.get(key)
+        if state is not None:
+            state.update(failures=[], strikes=state["strikes"] + 1, blockedUntil=until, expiresAt=expires_at)
+
+    async def clear(self, key: str) -> None:
+        self._states.pop(key, None)
+
+
+class MongoStore(ThrottleStore):
+    def __init__(self, collection: str = "login_attempts"):
+        self.collection = db[collection]
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": key})
+
+    async def add_failure(self, key: str, at: float, keep: int, expires_at: float) -> dict:
+        return await self.collection.find_one_and_update(
+            {"_id": key},
+            {
+                "$push": {"failures": {"$each": [at], "$slice": -keep}},
+                "$set": {"expiresAt": datetime.utcfromtimestamp(expires_at)},
+                "$setOnInsert": {"strikes": 0, "blockedUntil": 0.0}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def block(self, key: str, until: float, expires_at: float) -> None:
+        await self.collection.update_one(
+            {"_id": key},
+            {
+                "$set": {"failures": [], "blockedUntil": until, "expiresAt": datetime.utcfromtimestamp(expires_at)},
+                "$inc": {"strikes": 1}
+            }
+        )
+
+    async def clear(self, key: str) -> None:
+        await self.collection.delete_one({"_id": key})
+
+
+class LoginThrottle:
+    def __init__(
+        self,
+        store: ThrottleStore,
+        max_per_email: int,
+        max_per_ip: int,
+        window_seconds: float,
+        backoff_seconds: float,
+        max_backoff_seconds: float
+    ):
+        self.store = store
+        self.max_per_email = max_per_email
+        self.max_per_ip = max_per_ip
+        self.window_seconds = window_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.rejected = 0
+        self.blocks = 0
+
+    def _keys(self, ip: str, email: str):
+        return [(f"ip:{ip}", self.max_per_ip), (f"email:{email.lower()}", self.max_per_email)]
+
+    async def check(self, ip: str, email: str) -> None:
+        """Raise 429 if either the IP or the email is currently blocked"""
+        now = time.time()
+        for key, _ in self._keys(ip, email):
+            state = await self.store.get(key)
+            if state and state.get("blockedUntil", 0) > now:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many failed login attempts. Try again later.",
+                    headers={"Retry-After": str(math.ceil(state["blockedUntil"] - now))}
+                )
+
+    async def record_failure(self, ip: str, email: str) -> None:
+        now = time.time()
+        for key, limit in self._keys(ip, email):
+            state = await self.store.add_failure(key, now, limit, now + self.window_seconds)
+            recent = [at for at in state["failures"] if at > now - self.window_seconds]
+            if len(recent) >= limit:
+                backoff = min(self.backoff_seconds * 2 ** state["strikes"], self.max_backoff_seconds)
+                # Keep the key (and its strikes) around for a window beyond the block
+                await self.store.block(key, now + backoff, now + backoff + self.window_seconds)
+                self.blocks += 1
+
+    async def record_success(self, email: str) -> None:
+        # Only the email is cleared; one valid account must not unlock a flooding IP
+        await self.store.clear(f"email:{email.lower()}")
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "rejected": self.rejected,
+            "blocks": self.blocks,
+        }
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _create_store() -> ThrottleStore:
+    store = os.getenv("LOGIN_THROTTLE_STORE", "memory")
+    if store == "mongo":
+        return MongoStore()
+    return InMemoryStore()
+
+
+login_throttle = LoginThrottle(
+    _create_store(),
+    max_per_email=int(os.getenv("LOGIN_MAX_ATTEMPTS", "5")),
+    max_per_ip=int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "20")),
+    window_seconds=float(os.getenv("LOGIN_WINDOW_SECONDS", "300")),
+    backoff_seconds=float(os.getenv("LOGIN_BACKOFF_SECONDS", "30")),
+    max_backoff_seconds=float(os.getenv("LOGIN_MAX_BACKOFF_SECONDS", "3600")),
+)
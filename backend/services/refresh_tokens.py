@@ -0,0 +1,110 @@
+"""
+Rotating refresh tokens.
+
+Refresh tokens are opaque random strings; only their SHA-256 is stored. Each
+use revokes the presented token and issues a successor in the same family.
+Presenting an already-rotated token means it leaked, so the whole family is
+revoked.
+
+Tabs of one browser share a refresh token and may race to rotate it. For
+ROTATION_GRACE_SECONDS after a rotation the same token is answered with the
+successor already issued rather than treated as reuse. The successor is kept
+sealed with a key derived from the rotated token, so only its holder can open it.
+"""
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from database import db
+import hashlib
+import os
+import secrets
+import uuid
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+ROTATION_GRACE_SECONDS = int(os.getenv("REFRESH_ROTATION_GRACE_SECONDS", "30"))
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _seal(successor: str, token: str) -> str:
+    """XOR a successor with a keystream derived from the token it replaces (symmetric)"""
+    key = hashlib.sha512(f"successor:{token}".encode()).digest()
+    return bytes(a ^ b for a, b in zip(successor.encode(), key)).hex()
+
+
+def _unseal(sealed: str, token: str) -> str:
+    key = hashlib.sha512(f"successor:{token}".encode()).digest()
+    return bytes(a ^ b for a, b in zip(bytes.fromhex(sealed), key)).decode()
+
+
+def _invalid() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token"
+    )
+
+
+async def issue(user_id: str, family: Optional[str] = None, token: Optional[str] = None) -> str:
+    """Create and store a new refresh token"""
+    token = token or secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "tokenHash": _hash(token),
+        "userId": user_id,
+        "family": family or uuid.uuid4().hex,
+        "createdAt": now,
+        "expiresAt": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "revokedAt": None
+    })
+    return token
+
+
+async def rotate(token: str) -> Tuple[str, str]:
+    """Consume a refresh token; returns (user id, successor token)"""
+    now = datetime.utcnow()
+    successor = secrets.token_urlsafe(32)
+    record = await db.refresh_tokens.find_one_and_update(
+        {"tokenHash": _hash(token), "revokedAt": None, "expiresAt": {"$gt": now}},
+        {"$set": {"revokedAt": now, "successor": _seal(successor, token)}}
+    )
+    if record is None:
+        reused = await db.refresh_tokens.find_one(
+            {"tokenHash": _hash(token)},
+            {"userId": 1, "family": 1, "revokedAt": 1, "successor": 1}
+        )
+        if reused and reused.get("revokedAt"):
+            if reused.get("successor") and now - reused["revokedAt"] <= timedelta(seconds=ROTATION_GRACE_SECONDS):
+                # Another tab rotated this token moments ago: hand back the same successor unless it was
+                # revoked since (it may not be stored yet if that rotation is still in flight)
+                issued = _unseal(reused["successor"], token)
+                successor_record = await db.refresh_tokens.find_one({"tokenHash": _hash(issued)}, {"revokedAt": 1})
+                if successor_record is None or successor_record.get("revokedAt") is None:
+                    return reused["userId"], issued
+            await db.refresh_tokens.update_many(
+                {"family": reused["family"], "revokedAt": None},
+                {"$set": {"revokedAt": now}}
+            )
+        raise _invalid()
+
+    await issue(record["userId"], record["family"], successor)
+    return record["userId"], successor
+
+
+async def revoke(token: str) -> None:
+    await db.refresh_tokens.update_one(
+        {"tokenHash": _hash(token), "revokedAt": None},
+        {"$set": {"revokedAt": datetime.utcnow()}}
+    )
+
+
+async def revoke_user(user_id: str) -> None:
+    await revoke_users([user_id])
+
+
+async def revoke_users(user_ids: List[str]) -> None:
+    await db.refresh_tokens.update_many(
+        {"userId": {"$in": user_ids}, "revokedAt": None},
+        {"$set": {"revokedAt": datetime.utcnow()}}
+    )
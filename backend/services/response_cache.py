@@ -0,0 +1,115 @@
+"""
+Response cache for first-turn prompts.
+
+A prompt sent with no prior history gets the same answer whatever conversation
+it lands in, so its response is cached under a key built from the normalized
+prompt and every setting that shapes the reply. Prompts with attachments are
+never cached, since the key does not cover them. Entries live in a size-bounded
+in-memory LRU with a TTL and, when RESPONSE_CACHE_SHARED is set, in a Mongo
+collection with a TTL index so all workers share them.
+"""
+from typing import Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models.conversation import ConversationSettings
+from database import db
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold case, whitespace and trailing punctuation so trivially different prompts share a key"""
+    text = _WHITESPACE_RE.sub(" ", prompt.lower()).strip()
+    return text.strip("\"'").rstrip(".!?").strip()
+
+
+def cache_key(prompt: str, settings: ConversationSettings) -> str:
+    # Every generation setting is part of the key, so settings added later are covered too
+    generation = settings.model_dump(mode="json", exclude={"cacheResponses"})
+    generation.update(temperature=round(settings.temperature, 2), mcpTools=sorted(settings.mcpTools))
+    parts = [normalize_prompt(prompt), generation]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional shared Mongo) cache of assistant responses"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, shared: bool = False, collection: str = "response_cache"):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.collection = collection
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self._entries[key]
+
+        if self.shared:
+            try:
+                doc = await db[self.collection].find_one(
+                    {"_id": key, "expiresAt": {"$gt": datetime.utcnow()}},
+                    {"content": 1}
+                )
+            except Exception:
+                logger.exception("Shared response cache lookup failed")
+                doc = None
+            if doc:
+                self._store(key, doc["content"])
+                self.hits += 1
+                self.shared_hits += 1
+                return doc["content"]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, content: str) -> None:
+        self._store(key, content)
+        if self.shared:
+            try:
+                await db[self.collection].replace_one(
+                    {"_id": key},
+                    {"content": content, "expiresAt": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)},
+                    upsert=True
+                )
+            except Exception:
+                logger.exception("Shared response cache write failed")
+
+    def _store(self, key: str, content: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "sharedHits": self.shared_hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+    ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    shared=os.getenv("RESPONSE_CACHE_SHARED", "").lower() in ("1", "true", "yes"),
+)
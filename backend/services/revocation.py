@@ -0,0 +1,108 @@
+"""
+Access-token revocation.
+
+Revocations are written to `revoked_tokens` (expiring with the tokens they
+cover) and mirrored into an in-memory set on every worker. Workers pull new
+entries incrementally by `revokedAt`, so checking a token on each request is a
+set lookup, never a database round trip. Two kinds of entry exist: a single
+token by `jti`, or every token of a user (`sub`) issued before `notBefore`.
+"""
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from database import db
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+# Re-read a little history on each sync so entries committed out of order are not skipped
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class RevocationList:
+    def __init__(self, interval: float = SYNC_INTERVAL_SECONDS):
+        self.interval = interval
+        self._jtis: Dict[str, datetime] = {}
+        self._subjects: Dict[str, tuple] = {}
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.sync()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        if jti and jti in self._jtis:
+            return True
+        subject = self._subjects.get(payload.get("sub"))
+        if subject:
+            not_before, _ = subject
+            issued_at = payload.get("iat")
+            return issued_at is None or datetime.utcfromtimestamp(issued_at) < not_before
+        return False
+
+    def _apply(self, doc: dict) -> None:
+        if doc.get("jti"):
+            self._jtis[doc["jti"]] = doc["expiresAt"]
+        elif doc.get("sub"):
+            current = self._subjects.get(doc["sub"])
+            if not current or current[0] < doc["notBefore"]:
+                self._subjects[doc["sub"]] = (doc["notBefore"], doc["expiresAt"])
+
+    async def revoke_token(self, jti: str, expires_at: datetime) -> None:
+        doc = {"jti": jti, "expiresAt": expires_at, "revokedAt": datetime.utcnow()}
+        await db.revoked_tokens.insert_one(doc)
+        self._apply(doc)
+
+    async def revoke_subject(self, subject: str, lifetime: timedelta) -> None:
+        """Revoke every access token issued to `subject` so far"""
+        await self.revoke_subjects([subject], lifetime)
+
+    async def revoke_subjects(self, subjects: List[str], lifetime: timedelta) -> None:
+        """Revoke every access token issued to each of `subjects` so far, in one insert"""
+        if not subjects:
+            return
+        now = datetime.utcnow()
+        docs = [{"sub": subject, "notBefore": now, "expiresAt": now + lifetime, "revokedAt": now} for subject in subjects]
+        await db.revoked_tokens.insert_many(docs)
+        for doc in docs:
+            self._apply(doc)
+
+    async def sync(self) -> None:
+        """Pull revocations recorded since the last sync and drop expired ones"""
+        now = datetime.utcnow()
+        query = {"expiresAt": {"$gt": now}}
+        if self._watermark:
+            query["revokedAt"] = {"$gt": self._watermark - SYNC_OVERLAP}
+        async for doc in db.revoked_tokens.find(query).sort("revokedAt", 1):
+            self._apply(doc)
+            if not self._watermark or doc["revokedAt"] > self._watermark:
+                self._watermark = doc["revokedAt"]
+        if self._watermark is None:
+            self._watermark = now
+
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        self._subjects = {sub: entry for sub, entry in self._subjects.items() if entry[1] > now}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Revocation sync failed")
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._jtis), "subjects": len(self._subjects)}
+
+
+revocations = RevocationList()
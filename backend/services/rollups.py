@@ -0,0 +1,246 @@
+"""
+Time-bucketed counters for analytics.
+
+Activities and completed chat turns are counted into per-minute, per-hour and
+per-day buckets, split by a few dimensions (action, resource, plan, model).
+Increments are accumulated in memory and flushed periodically as one
+bulk_write of `$inc` upserts, so a burst of events costs a handful of writes
+and a chart over any range reads one document per bucket and dimension value.
+Minute and hour buckets expire after their retention period; day buckets are
+kept.
+
+`rebuild` recounts whole, closed days from the source collections. It only
+touches days the sources still fully cover, since activities expire after
+ACTIVITY_RETENTION_DAYS, so older buckets are never lost.
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from database import db
+from services.user_cache import user_profiles
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+RETENTION_DAYS = {
+    "minute": int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "7")),
+    "hour": int(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "365")),
+    "day": 0,
+}
+METRIC_DIMENSIONS = {
+    "activity": ("action", "resource", "plan"),
+    "turns": ("model", "plan"),
+}
+MAX_QUERY_BUCKETS = 2000
+# The ledger keeps each turn's usage and is never compacted, unlike messages
+REBUILD_SOURCES = {
+    "activity": ("activities", {"timestamp": {"$exists": True}}),
+    "turns": ("credit_transactions", {"metadata.usage": {"$exists": True}}),
+}
+# How long after a day ends its events may still be in flight to the live counters
+REBUILD_SETTLE_SECONDS = 3600
+
+Key = Tuple[str, str, datetime, Tuple[Tuple[str, str], ...]]
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    seconds = GRANULARITIES[granularity]
+    epoch = datetime(1970, 1, 1)
+    offset = int((timestamp - epoch).total_seconds()) // seconds * seconds
+    return epoch + timedelta(seconds=offset)
+
+
+async def user_plan(user_id: str) -> str:
+    profile = await user_profiles.get(user_id) or {}
+    return profile.get("subscription", {}).get("plan", "free")
+
+
+class RollupAggregator:
+    """Accumulates counter increments and flushes them as bulk upserts"""
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self.flushes = 0
+        self._pending: Dict[Key, Dict[str, float]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def record(self, metric: str, timestamp: datetime, dims: Dict[str, str], **counts: float) -> None:
+        """Count one event (plus any extra counts such as tokens) into every granularity"""
+        counts.setdefault("events", 1)
+        dim_key = tuple(sorted((name, str(value)) for name, value in dims.items()))
+        for granularity in GRANULARITIES:
+            key = (metric, granularity, bucket_start(timestamp, granularity), dim_key)
+            pending = self._pending.setdefault(key, {})
+            for name, value in counts.items():
+                pending[name] = pending.get(name, 0) + value
+
+    def _merge(self, pending: Dict[Key, Dict[str, float]]) -> None:
+        for key, counts in pending.items():
+            current = self._pending.setdefault(key, {})
+            for name, value in counts.items():
+                current[name] = current.get(name, 0) + value
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            now = datetime.utcnow()
+            operations = []
+            for (metric, granularity, bucket, dim_key), counts in pending.items():
+                dims = dict(dim_key)
+                doc_id = "|".join([metric, granularity, bucket.isoformat()] + [f"{k}={v}" for k, v in dim_key])
+                on_insert = {"metric": metric, "granularity": granularity, "bucket": bucket, "dims": dims}
+                if RETENTION_DAYS[granularity]:
+                    on_insert["expiresAt"] = bucket + timedelta(days=RETENTION_DAYS[granularity])
+                    if on_insert["expiresAt"] <= now:
+                        # Only a rebuild reaches this far back; the TTL monitor would drop it right away
+                        continue
+                operations.append(UpdateOne(
+                    {"_id": doc_id},
+                    {"$inc": {f"counts.{name}": value for name, value in counts.items()}, "$setOnInsert": on_insert},
+                    upsert=True
+                ))
+            if not operations:
+                return
+            try:
+                await db.rollups.bulk_write(operations, ordered=False)
+                self.flushes += 1
+            except Exception:
+                # Counts are additive, so putting them back and retrying later is safe
+                logger.exception("Failed to flush %d rollup counters", len(operations))
+                self._merge(pending)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "flushes": self.flushes}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+async def query(
+    metric: str,
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    group_by: Optional[str] = None,
+    filters: Optional[Dict[str, str]] = None
+) -> List[dict]:
+    """Counters per bucket (and per `group_by` value) for buckets starting in [start, end)"""
+    match = {
+        "metric": metric,
+        "granularity": granularity,
+        "bucket": {"$gte": bucket_start(start, granularity), "$lt": end},
+    }
+    for name, value in (filters or {}).items():
+        match[f"dims.{name}"] = value
+
+    group_id = {"bucket": "$bucket"}
+    if group_by:
+        group_id[group_by] = f"$dims.{group_by}"
+    rows = await db.rollups.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": group_id,
+            "events": {"$sum": "$counts.events"},
+            "tokens": {"$sum": "$counts.tokens"},
+            "credits": {"$sum": "$counts.credits"},
+        }},
+        {"$sort": {"_id.bucket": 1}}
+    ]).to_list(None)
+
+    results = []
+    for row in rows:
+        entry = {**row["_id"], "events": row["events"]}
+        if metric == "turns":
+            entry.update(tokens=row["tokens"], credits=round(row["credits"], 6))
+        results.append(entry)
+    return results
+
+
+def _ceil_day(timestamp: datetime) -> datetime:
+    day = bucket_start(timestamp, "day")
+    return day if day == timestamp else day + timedelta(days=1)
+
+
+async def _covered_days(metric: str, start: Optional[datetime], end: Optional[datetime]) -> Optional[Tuple[datetime, datetime]]:
+    """Whole days within [start, end) for which the source still holds every event of `metric`"""
+    collection, source_filter = REBUILD_SOURCES[metric]
+    oldest = await db[collection].find(source_filter, {"timestamp": 1}).sort("timestamp", 1).limit(1).to_list(1)
+    if not oldest:
+        return None
+
+    first = bucket_start(oldest[0]["timestamp"], "day")
+    # Buckets before the oldest event mean older events have expired from the source, so its first day is partial
+    if await db.rollups.count_documents({"metric": metric, "bucket": {"$lt": first}}, limit=1):
+        first = _ceil_day(oldest[0]["timestamp"])
+
+    # Only closed days: buckets still receiving live increments are left to the live counters
+    last = bucket_start(datetime.utcnow() - timedelta(seconds=REBUILD_SETTLE_SECONDS), "day")
+    lower = max(first, _ceil_day(start)) if start else first
+    upper = min(last, bucket_start(end, "day")) if end else last
+    return (lower, upper) if lower < upper else None
+
+
+async def rebuild(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = 5000
+) -> Dict[str, dict]:
+    """Recompute rollups from activities and the credit ledger for the days both still cover"""
+    plans = {}
+    async for user in db.users.find({}, {"subscription.plan": 1}):
+        plans[str(user["_id"])] = user.get("subscription", {}).get("plan", "free")
+
+    results = {}
+    for metric, (collection, source_filter) in REBUILD_SOURCES.items():
+        days = await _covered_days(metric, start, end)
+        results[metric] = {"count": 0, "start": days and days[0], "end": days and days[1]}
+        if days is None:
+            continue
+
+        # Buckets outside the covered days, including everything older than the source, are kept as they are
+        await db.rollups.delete_many({"metric": metric, "bucket": {"$gte": days[0], "$lt": days[1]}})
+        aggregator = RollupAggregator()
+        query = {**source_filter, "timestamp": {"$gte": days[0], "$lt": days[1]}}
+        async for doc in db[collection].find(query).batch_size(batch_size):
+            if metric == "activity":
+                aggregator.record("activity", doc["timestamp"], {
+                    "action": doc.get("action"),
+                    "resource": doc.get("resource"),
+                    "plan": plans.get(doc.get("userId"), "free"),
+                })
+            else:
+                usage = doc["metadata"]["usage"]
+                aggregator.record(
+                    "turns",
+                    doc["timestamp"],
+                    {"model": usage.get("model"), "plan": plans.get(doc.get("userId"), "free")},
+                    tokens=usage.get("totalTokens", 0),
+                    credits=usage.get("credits", 0.0)
+                )
+            results[metric]["count"] += 1
+            if results[metric]["count"] % batch_size == 0:
+                await aggregator.flush()
+        await aggregator.flush()
+
+    return results
+
+
+rollups = RollupAggregator(flush_interval=float(os.getenv("ROLLUP_FLUSH_SECONDS", "5")))
@@ -0,0 +1,168 @@
+"""
+Materialized system statistics for the admin dashboard.
+
+The counts live in a single `stats` document. Writes that change them (user
+signup and deletion, login activity, project create/delete/status changes,
+plan changes) apply `$inc` deltas to it, and a background worker recomputes it
+from scratch periodically so any drift is corrected. Recomputing runs one
+`$facet` aggregation per collection, concurrently.
+"""
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+from models.project import ProjectStatus
+from models.user import SubscriptionPlan
+from database import db
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ID = "system"
+ACTIVE_USER_DAYS = 30
+STATS_RECOMPUTE_SECONDS = int(os.getenv("STATS_RECOMPUTE_SECONDS", "300"))
+
+
+def _count(facet: list) -> int:
+    return facet[0]["n"] if facet else 0
+
+
+def _grouped(facet: list, keys) -> Dict[str, int]:
+    counts = {key: 0 for key in keys}
+    counts.update((row["_id"], row["n"]) for row in facet if row["_id"] is not None)
+    return counts
+
+
+async def _user_counts() -> dict:
+    active_since = datetime.utcnow() - timedelta(days=ACTIVE_USER_DAYS)
+    result = await db.users.aggregate([
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "active": [{"$match": {"lastLogin": {"$gte": active_since}}}, {"$count": "n"}],
+            "bySubscription": [{"$group": {"_id": "$subscription.plan", "n": {"$sum": 1}}}]
+        }}
+    ]).to_list(1)
+    facets = result[0]
+    return {
+        "total": _count(facets["total"]),
+        "active": _count(facets["active"]),
+        "bySubscription": _grouped(facets["bySubscription"], [plan.value for plan in SubscriptionPlan])
+    }
+
+
+async def _project_counts() -> dict:
+    result = await db.projects.aggregate([
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "byStatus": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}]
+        }}
+    ]).to_list(1)
+    facets = result[0]
+    return {
+        "total": _count(facets["total"]),
+        **_grouped(facets["byStatus"], [s.value for s in ProjectStatus])
+    }
+
+
+async def recompute() -> dict:
+    """Rebuild the snapshot from the collections"""
+    users, projects = await asyncio.gather(_user_counts(), _project_counts())
+    snapshot = {"users": users, "projects": projects, "computedAt": datetime.utcnow()}
+    await db.stats.replace_one({"_id": SNAPSHOT_ID}, snapshot, upsert=True)
+    return snapshot
+
+
+async def get_snapshot(refresh: bool = False) -> dict:
+    snapshot = None if refresh else await db.stats.find_one({"_id": SNAPSHOT_ID}, {"_id": 0})
+    if snapshot is None:
+        snapshot = await recompute()
+    return snapshot
+
+
+async def bump(deltas: Dict[str, int]) -> None:
+    """Apply counter deltas, e.g. {"users.total": 1}, to the snapshot
+
+    Never raises: a lost delta only means drift until the next recompute.
+    """
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+    try:
+        # No upsert: until the first recompute there is nothing to keep current
+        await db.stats.update_one({"_id": SNAPSHOT_ID}, {"$inc": deltas})
+    except Exception:
+        logger.exception("Failed to update stats snapshot")
+
+
+def _value(value) -> str:
+    return getattr(value, "value", value)
+
+
+def is_active(last_login: Optional[datetime]) -> bool:
+    return last_login is not None and last_login >= datetime.utcnow() - timedelta(days=ACTIVE_USER_DAYS)
+
+
+async def user_removed(user: dict) -> None:
+    await users_removed([user])
+
+
+async def users_removed(users) -> None:
+    deltas = {
+        "users.total": -len(users),
+        "users.active": -sum(1 for user in users if is_active(user.get("lastLogin"))),
+    }
+    for user in users:
+        key = f"users.bySubscription.{_value(user.get('subscription', {}).get('plan', SubscriptionPlan.FREE))}"
+        deltas[key] = deltas.get(key, 0) - 1
+    await bump(deltas)
+
+
+async def plans_changed(users, new_plan) -> None:
+    """Move users (documents holding their previous plan) to `new_plan`"""
+    deltas = {f"users.bySubscription.{_value(new_plan)}": len(users)}
+    for user in users:
+        key = f"users.bySubscription.{_value(user.get('subscription', {}).get('plan', SubscriptionPlan.FREE))}"
+        deltas[key] = deltas.get(key, 0) - 1
+    await bump(deltas)
+
+
+async def projects_removed(projects) -> None:
+    deltas = {"projects.total": -len(projects)}
+    for project in projects:
+        key = f"projects.{_value(project.get('status', ProjectStatus.DRAFT))}"
+        deltas[key] = deltas.get(key, 0) - 1
+    await bump(deltas)
+
+
+async def project_status_changed(old, new) -> None:
+    old, new = _value(old), _value(new)
+    if old != new:
+        await bump({f"projects.{old}": -1, f"projects.{new}": 1})
+
+
+class StatsWorker:
+    """Recomputes the snapshot periodically to correct drift"""
+
+    def __init__(self, interval: int = STATS_RECOMPUTE_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await recompute()
+            except Exception:
+                logger.exception("Stats recompute failed")
+            await asyncio.sleep(self.interval)
+
+
+stats_worker = StatsWorker()
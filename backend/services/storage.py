@@ -0,0 +1,142 @@
+"""
+Blob storage for uploaded files.
+
+Uploads are first appended to a per-upload staging part, then committed under
+their content digest, so identical files share one blob. Blobs are reference
+counted in the `blobs` collection and deleted with their last reference. BlobStorage is the
+interface the upload routes use; LocalBlobStorage keeps everything on the local
+filesystem and runs file I/O in worker threads to keep the event loop free.
+"""
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+from pathlib import Path
+import asyncio
+import os
+import shutil
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class PartWriter(ABC):
+    """Append-only handle on an upload's staging part"""
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
+
+class BlobStorage(ABC):
+    """Staging parts keyed by upload id, committed blobs keyed by digest"""
+
+    @abstractmethod
+    async def open_part(self, upload_id: str) -> PartWriter:
+        """Open the staging part for appending, creating it if needed"""
+
+    @abstractmethod
+    async def part_size(self, upload_id: str) -> int:
+        pass
+
+    @abstractmethod
+    async def truncate_part(self, upload_id: str, size: int) -> None:
+        pass
+
+    @abstractmethod
+    def read_part(self, upload_id: str) -> AsyncIterator[bytes]:
+        pass
+
+    @abstractmethod
+    async def discard_part(self, upload_id: str) -> None:
+        pass
+
+    @abstractmethod
+    async def commit_part(self, upload_id: str, key: str) -> None:
+        """Move a finished part to the blob stored under `key`"""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def read_blob(self, key: str) -> AsyncIterator[bytes]:
+        pass
+
+    @abstractmethod
+    async def delete_blob(self, key: str) -> None:
+        pass
+
+
+class _LocalPartWriter(PartWriter):
+    def __init__(self, handle):
+        self.handle = handle
+
+    async def write(self, data: bytes) -> None:
+        await asyncio.to_thread(self.handle.write, data)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.handle.close)
+
+
+class LocalBlobStorage(BlobStorage):
+    """Filesystem storage: parts under <root>/parts, blobs under <root>/blobs/<xx>/<digest>"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.root / "parts" / upload_id
+
+    def _blob_path(self, key: str) -> Path:
+        return self.root / "blobs" / key[:2] / key
+
+    async def open_part(self, upload_id: str) -> PartWriter:
+        path = self._part_path(upload_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle = await asyncio.to_thread(open, path, "ab")
+        return _LocalPartWriter(handle)
+
+    async def part_size(self, upload_id: str) -> int:
+        path = self._part_path(upload_id)
+        return path.stat().st_size if path.exists() else 0
+
+    async def truncate_part(self, upload_id: str, size: int) -> None:
+        await asyncio.to_thread(os.truncate, self._part_path(upload_id), size)
+
+    async def _read(self, path: Path) -> AsyncIterator[bytes]:
+        handle = await asyncio.to_thread(open, path, "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(handle.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            handle.close()
+
+    def read_part(self, upload_id: str) -> AsyncIterator[bytes]:
+        return self._read(self._part_path(upload_id))
+
+    async def discard_part(self, upload_id: str) -> None:
+        self._part_path(upload_id).unlink(missing_ok=True)
+
+    async def commit_part(self, upload_id: str, key: str) -> None:
+        target = self._blob_path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(shutil.move, str(self._part_path(upload_id)), str(target))
+
+    async def exists(self, key: str) -> bool:
+        return self._blob_path(key).exists()
+
+    def read_blob(self, key: str) -> AsyncIterator[bytes]:
+        return self._read(self._blob_path(key))
+
+    async def delete_blob(self, key: str) -> None:
+        self._blob_path(key).unlink(missing_ok=True)
+
+
+storage: BlobStorage = LocalBlobStorage(
+    Path(os.getenv("UPLOAD_DIR", str(Path(__file__).parent.parent / "uploads")))
+)
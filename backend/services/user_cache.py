@@ -0,0 +1,78 @@
+"""
+Cached user profile lookups.
+
+Hot paths (/auth/me, project plan limits) need a handful of user fields, never
+the password hash or project list. Profiles are fetched with a projection and
+kept in a bounded in-process LRU for a short TTL; writers that change these
+fields call `invalidate` so this worker never serves its own stale writes, and
+the TTL bounds staleness for writes made on other workers.
+"""
+from typing import Optional
+from collections import OrderedDict
+from bson import ObjectId
+from database import db
+import os
+import time
+
+PROFILE_PROJECTION = {
+    "email": 1,
+    "name": 1,
+    "avatar": 1,
+    "role": 1,
+    "provider": 1,
+    "subscription": 1,
+    "credits": 1,
+    "createdAt": 1,
+    "lastLogin": 1,
+}
+
+
+class UserProfileCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """Profile fields for a user, or None if the user does not exist"""
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[1])
+
+        self.misses += 1
+        try:
+            profile = await db.users.find_one({"_id": ObjectId(user_id)}, PROFILE_PROJECTION)
+        except Exception:
+            return None
+        if profile is None:
+            self._entries.pop(user_id, None)
+            return None
+
+        profile["_id"] = str(profile["_id"])
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return dict(profile)
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+user_profiles = UserProfileCache(
+    max_entries=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL", "30")),
+)
@@ -1,10 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from services.refresh_tokens import REFRESH_TOKEN_EXPIRE_DAYS
+from services.revocation import revocations
+import asyncio
+import hashlib
 import os
+import time
+import uuid
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,7 +20,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 
 security = HTTPBearer()
 
@@ -24,6 +32,65 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHasher:
+    """Runs bcrypt in a dedicated thread pool so it never blocks the event loop.
+
+    At most `max_workers` hashes run at once and at most `max_queue` more may wait;
+    beyond that requests are rejected immediately with 503 instead of piling up.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "maxWorkers": self.max_workers,
+            "maxQueue": self.max_queue,
+            "inFlight": self.in_flight,
+            "queued": max(self.in_flight - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avgSeconds": round(self.total_seconds / self.completed, 4) if self.completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+password_hasher = PasswordHasher(
+    max_workers=int(os.getenv("BCRYPT_MAX_WORKERS", "4")),
+    max_queue=int(os.getenv("BCRYPT_MAX_QUEUE", "32")),
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -32,21 +99,115 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # iat keeps sub-second precision so a revocation cannot miss tokens issued in the same second
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class TokenCache:
+    """Bounded LRU of verified tokens (keyed by digest) mapped to their decoded claims.
+
+    Entries are dropped once the token's `exp` passes, so a cache hit is exactly as
+    valid as a fresh jwt.decode. `invalidate` and `invalidate_subject` let revocation
+    evict tokens before they expire.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        payload = self._entries.get(key)
+        if payload is not None:
+            if payload.get("exp", 0) > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(payload)
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, payload: dict) -> None:
+        if "exp" not in payload:
+            return
+        self._entries[self._key(token)] = dict(payload)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        self._entries.pop(self._key(token), None)
+
+    def invalidate_subject(self, subject: str) -> None:
+        """Evict every cached token issued to a user"""
+        self.invalidate_subjects([subject])
+
+    def invalidate_subjects(self, subjects: List[str]) -> None:
+        """Evict every cached token issued to any of `subjects`, in one pass"""
+        subjects = set(subjects)
+        for key in [k for k, payload in self._entries.items() if payload.get("sub") in subjects]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+token_cache = TokenCache(max_entries=int(os.getenv("TOKEN_CACHE_SIZE", "10000")))
+
 def decode_token(token: str) -> dict:
     """Decode and verify a JWT token"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        token_cache.put(token, payload)
+    
+    # In-memory check; the revocation list is synced from Mongo in the background
+    if revocations.is_revoked(payload):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
+            detail="Token has been revoked",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload
+
+async def revoke_access_token(token: str) -> None:
+    """Revoke a single access token until it expires"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return
+    token_cache.invalidate(token)
+    if payload.get("jti"):
+        await revocations.revoke_token(payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+
+async def revoke_user_tokens(user_id: str) -> None:
+    """Revoke every access token issued to a user so far"""
+    await revoke_users_tokens([user_id])
+
+async def revoke_users_tokens(user_ids: List[str]) -> None:
+    """Revoke every access token issued so far to each of several users"""
+    token_cache.invalidate_subjects(user_ids)
+    # A subject revocation must outlive every credential issued before it
+    ttl = max(timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    await revocations.revoke_subjects(user_ids, ttl)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Get current user from JWT token"""
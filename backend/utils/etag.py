@@ -0,0 +1,37 @@
+from typing import Any, Optional
+from fastapi import Request, Response
+import hashlib
+import json
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag over cheap validator parts (ids, updatedAt stamps, counts, versions)"""
+    raw = json.dumps(parts, default=str, separators=(",", ":")).encode()
+    return 'W/"{}"'.format(hashlib.blake2b(raw, digest_size=12).hexdigest())
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match, which may list several tags or be *"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def check_etag(request: Request, response: Response, *parts: Any) -> Optional[Response]:
+    """Return a 304 if the client already has this version, else tag the outgoing response
+
+    Call it before loading or serializing the body so a match skips that work entirely.
+    """
+    etag = make_etag(*parts)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from bson import ObjectId
+import base64
+import json
+
+def encode_cursor(value: Any, doc_id: Any) -> str:
+    """Encode a (sort value, _id) pair as an opaque cursor"""
+    if isinstance(value, datetime):
+        payload = {"t": value.isoformat(), "id": str(doc_id)}
+    else:
+        payload = {"v": value, "id": str(doc_id)}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, ObjectId]:
+    """Decode an opaque cursor back into a (sort value, _id) pair"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["t"]) if "t" in payload else payload["v"]
+        return value, ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_filter(field: str, cursor: Optional[str], direction: int) -> Dict[str, Any]:
+    """Build a filter selecting documents strictly after a cursor in the given sort direction"""
+    if not cursor:
+        return {}
+    value, doc_id = decode_cursor(cursor)
+    op = "$gt" if direction > 0 else "$lt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "_id": {op: doc_id}}
+    ]}
+
+def set_cursor_headers(response, next_cursor: Optional[str] = None, prev_cursor: Optional[str] = None, has_more: bool = False) -> None:
+    """Expose pagination cursors on a list response"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if prev_cursor:
+        response.headers["X-Prev-Cursor"] = prev_cursor
+    response.headers["X-Has-More"] = "true" if has_more else "false"
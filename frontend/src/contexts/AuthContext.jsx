@@ -6,6 +6,26 @@ const AuthContext = createContext(null);
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Tabs share one refresh token, and rotating it invalidates it. Rotate under a
+// cross-tab lock so only one tab spends it; a tab that waited on the lock finds
+// the tokens the other one stored and uses those instead.
+const refreshSession = async () => {
+  const presented = localStorage.getItem('refreshToken');
+  const rotate = async () => {
+    const current = localStorage.getItem('refreshToken');
+    if (!current) {
+      throw new Error('Signed out');
+    }
+    if (current !== presented) {
+      return { access_token: localStorage.getItem('token'), refresh_token: current };
+    }
+    const response = await axios.post(`${API}/auth/refresh`, { refresh_token: current });
+    return response.data;
+  };
+  // Without the Web Locks API the server's rotation grace window covers the race
+  return navigator.locks ? navigator.locks.request('auth-refresh', rotate) : rotate();
+};
+
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -20,21 +40,103 @@ export const AuthProvider = ({ children }) => {
     }
   }, [token]);
 
+  const storeTokens = ({ access_token, refresh_token }) => {
+    localStorage.setItem('token', access_token);
+    if (refresh_token) {
+      localStorage.setItem('refreshToken', refresh_token);
+    }
+    axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+    setToken(access_token);
+  };
+
+  const clearTokens = () => {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
+    setToken(null);
+    delete axios.defaults.headers.common['Authorization'];
+  };
+
+  // Access tokens are short-lived: on a 401, rotate the refresh token once and retry
+  useEffect(() => {
+    let refreshing = null;
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (
+          error.response?.status !== 401 ||
+          !refreshToken ||
+          original._retried ||
+          original.url?.includes('/auth/')
+        ) {
+          return Promise.reject(error);
+        }
+        original._retried = true;
+        try {
+          refreshing = refreshing || refreshSession();
+          const tokens = await refreshing;
+          storeTokens(tokens);
+          original.headers['Authorization'] = `Bearer ${tokens.access_token}`;
+          return axios(original);
+        } catch (refreshError) {
+          clearTokens();
+          setUser(null);
+          return Promise.reject(error);
+        } finally {
+          refreshing = null;
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
+  // Follow token changes made by other tabs (a refresh, login or logout there)
+  useEffect(() => {
+    const onStorage = (event) => {
+      if (event.key !== 'token') {
+        return;
+      }
+      if (event.newValue) {
+        axios.defaults.headers.common['Authorization'] = `Bearer ${event.newValue}`;
+        setToken(event.newValue);
+      } else {
+        delete axios.defaults.headers.common['Authorization'];
+        setToken(null);
+        setUser(null);
+      }
+    };
+    window.addEventListener('storage', onStorage);
+    return () => window.removeEventListener('storage', onStorage);
+  }, []);
+
   // Check if user is logged in on mount
   useEffect(() => {
     const checkAuth = async () => {
       const savedToken = localStorage.getItem('token');
       if (savedToken) {
         try {
-          const response = await axios.get(`${API}/auth/me`, {
-            headers: { Authorization: `Bearer ${savedToken}` }
-          });
+          let response;
+          try {
+            response = await axios.get(`${API}/auth/me`, {
+              headers: { Authorization: `Bearer ${savedToken}` }
+            });
+            setToken(savedToken);
+          } catch (error) {
+            const refreshToken = localStorage.getItem('refreshToken');
+            if (error.response?.status !== 401 || !refreshToken) {
+              throw error;
+            }
+            const refreshed = await refreshSession();
+            storeTokens(refreshed);
+            response = await axios.get(`${API}/auth/me`, {
+              headers: { Authorization: `Bearer ${refreshed.access_token}` }
+            });
+          }
           setUser(response.data);
-          setToken(savedToken);
         } catch (error) {
           console.error('Auth check failed:', error);
-          localStorage.removeItem('token');
-          setToken(null);
+          clearTokens();
         }
       }
       setLoading(false);
@@ -46,10 +148,9 @@ export const AuthProvider = ({ children }) => {
   const login = async (email, password) => {
     try {
       const response = await axios.post(`${API}/auth/login`, { email, password });
-      const { access_token, user: userData } = response.data;
+      const { user: userData } = response.data;
       
-      localStorage.setItem('token', access_token);
-      setToken(access_token);
+      storeTokens(response.data);
       setUser(userData);
       
       return { success: true };
@@ -64,10 +165,9 @@ export const AuthProvider = ({ children }) => {
   const register = async (name, email, password) => {
     try {
       const response = await axios.post(`${API}/auth/register`, { name, email, password });
-      const { access_token, user: userData } = response.data;
+      const { user: userData } = response.data;
       
-      localStorage.setItem('token', access_token);
-      setToken(access_token);
+      storeTokens(response.data);
       setUser(userData);
       
       return { success: true };
@@ -80,10 +180,10 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
-    localStorage.removeItem('token');
-    setToken(null);
+    const refreshToken = localStorage.getItem('refreshToken');
+    axios.post(`${API}/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
+    clearTokens();
     setUser(null);
-    delete axios.defaults.headers.common['Authorization'];
   };
 
   const value = {